@@ -27,15 +27,18 @@ import csv
 import ast
 import math
 import itertools
-import copy
+import hashlib
+import datetime
 from dataclasses import dataclass
 from collections import defaultdict
 from enum import Enum
 
-from typing import List, Tuple, FrozenSet, Callable, Union
+from typing import List, Tuple, FrozenSet, Callable, Union, Optional
 
 import learning.fpt as fpt
 import learning.alergia as alergia
+import learning.ktails as ktails
+import learning.memo as memo
 import wfa.core_wfa as core_wfa
 import wfa.core_wfa_export as core_wfa_export
 import wfa.matrix_wfa as matrix_wfa
@@ -43,6 +46,7 @@ import parser.IEC104_parser as con_par
 import parser.conversation_parser_base as con_base
 import detection.distr_comparison as distr
 import detection.member as mem
+import detection.model_store as model_store
 import parser.IEC104_conv_parser as iec_prep_par
 
 SPARSE = False
@@ -51,6 +55,14 @@ rows_filter_normal = ["asduType", "cot"]
 DURATION = 300
 AGGREGATE = True
 ACCELERATE = False
+## Number of learned automata kept in the learning cache
+CACHE_SIZE = 256
+## Number of the most probable missing conversations reported for a window
+MISSING = 3
+## Minimize learned automata (merge probabilistically bisimilar states)
+MINIMIZE = False
+## Total numbers of states of learned automata before and after the minimization
+minimized_states = [0, 0]
 
 
 ComPairType = FrozenSet[Tuple[str,str]]
@@ -70,6 +82,7 @@ Program parameters
 class AutType(Enum):
     PA = 0
     PTA = 1
+    KTAILS = 2
 
 
 class InputFormat(Enum):
@@ -78,11 +91,12 @@ class InputFormat(Enum):
 
 
 """!
-Details about the anomalies
+Details about the anomalies (automata are shared frozen automata, explanations
+are computed when the anomaly is printed)
 """
 @dataclass
 class AnomDetails:
-    bad_conv : List
+    window : List
     test_aut : core_wfa.CoreWFA
     model_aut : core_wfa.CoreWFA
 
@@ -109,6 +123,17 @@ def abstraction(item: dict[str, str]) -> Tuple[str, ...]:
     return tuple([item[k] for k in rows_filter_normal])
 
 
+"""
+Optional minimization of a learned PA (see MINIMIZE)
+"""
+def post_learning(aut: core_wfa_export.CoreWFAExport) -> core_wfa_export.CoreWFAExport:
+    if MINIMIZE:
+        minimized_states[0] += len(aut.get_states())
+        aut.minimize()
+        minimized_states[1] += len(aut.get_states())
+    return aut
+
+
 """
 PA learning
 """
@@ -122,7 +147,7 @@ def learn_proc_pa(training: List) -> core_wfa_export.CoreWFAExport:
         t0 = 1
     aut = alergia.alergia(tree, alpha, t0)
     aut.rename_states()
-    return aut.normalize()
+    return post_learning(aut.normalize())
 
 
 """
@@ -133,7 +158,18 @@ def learn_proc_pta(training: List) -> core_wfa_export.CoreWFAExport:
     tree.add_string_list(training)
     aut = tree
     aut.rename_states()
-    return aut.normalize()
+    return post_learning(aut.normalize())
+
+
+"""
+PA learning using k-tails
+"""
+def learn_proc_ktails(training: List) -> core_wfa_export.CoreWFAExport:
+    tree = fpt.FPT()
+    tree.add_string_list(training)
+    aut = ktails.ktails(tree, ktails.K)
+    aut.rename_states()
+    return post_learning(aut.normalize())
 
 
 """
@@ -202,18 +238,36 @@ def learn_golden_member(parser: con_base.ConvParserBase, learn_proc: Callable, p
     return ret
 
 
+"""
+Store a golden map together with learning parameters and provenance (the
+provenance of the valid traffic file is computed if it is not given)
+"""
+def store_golden_map(path: str, golden_map: dict[ComPairType, AutListType], par: Params, provenance: Optional[dict] = None) -> None:
+    params = {"aut_type": par.aut_type.name, "alg": par.alg.name, "smoothing": par.smoothing, \
+        "minimize": MINIMIZE, "duration": DURATION, "abstraction": rows_filter_normal}
+    if provenance is None:
+        with open(par.normal_file, "rb") as fd:
+            digest = hashlib.sha256(fd.read()).hexdigest()
+        provenance = {"normal_file": os.path.abspath(par.normal_file), "sha256": digest, \
+            "format": par.file_format.name, "created": datetime.datetime.now().isoformat(timespec="seconds")}
+    model_store.save_golden_map(path, golden_map, params, provenance)
+
+
 """
 Print help message
 """
 def print_help():
     print("./anomaly_distr <valid traffic csv> <anomaly csv> [OPT]")
     print("OPT are from the following: ")
-    print("\t--atype=pa/pta\t\tlearning based on PAs/PTAs (default PA)")
+    print("\t--atype=pa/pta/ktails\tlearning based on PAs (Alergia)/PTAs/PAs (k-tails) (default PA)")
     print("\t--alg=distr/member\tanomaly detection based on comparing distributions (distr) or single message reasoning (member) (default distr)")
     print("\t--format=conv/ipfix\tformat of input data: conversations (conv) or csv data in ipfix format (ipfix)")
     print("\t--smoothing\t\tuse smoothing (for distr only)")
     print("\t--reduced=val\t\tremove similar automata with the error upper-bound val [0,1] (for distr only)")
     print("\t--threshold=val\t\tdetect anomalies with a given threshold (for distr only)")
+    print("\t--minimize\t\tminimize learned automata (merge probabilistically bisimilar states)")
+    print("\t--save=file\t\tstore the golden models into a binary file (the anomaly csv can be omitted)")
+    print("\t--load\t\t\tload the golden models from a binary file given instead of the valid traffic csv")
     print("\t--help\t\t\tprint this message")
 
 
@@ -221,10 +275,9 @@ def print_help():
 Distribution-comparison-based anomaly detection
 """
 def main():
+    global MINIMIZE
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hr:t:a:sf:", ["help", "reduced=", "atype=", "alg=", "smoothing", "format=", "threshold="])
-        if len(args) > 1:
-            opts, _ = getopt.getopt(sys.argv[3:], "hr:t:a:sf:", ["help", "reduced=", "atype=", "alg=", "smoothing", "format=", "threshold="])
+        opts, args = getopt.gnu_getopt(sys.argv[1:], "hr:t:a:sf:", ["help", "reduced=", "atype=", "alg=", "smoothing", "format=", "threshold=", "minimize", "save=", "load"])
     except getopt.GetoptError as err:
         sys.stderr.write("Error: bad parameters (try --help)\n")
         sys.exit(1)
@@ -232,6 +285,11 @@ def main():
     par = Params(Algorithms.DISTR, None, None, AutType.PA, None, False, InputFormat.IPFIX, None)
     learn_proc = learn_proc_pa
     golden_proc = learn_golden_distr
+    save_file = None
+    load = False
+    provenance = None
+    # learner options given explicitly (checked against loaded golden models)
+    explicit = dict()
 
     for o, a in opts:
         if o in ("--atype", "-t"):
@@ -241,6 +299,10 @@ def main():
             elif a == "pta":
                 par.aut_type = AutType.PTA
                 learn_proc = learn_proc_pta
+            elif a == "ktails":
+                par.aut_type = AutType.KTAILS
+                learn_proc = learn_proc_ktails
+            explicit["aut_type"] = par.aut_type.name
         elif o in ("--alg", "-a"):
             if a == "distr":
                 par.alg = Algorithms.DISTR
@@ -248,10 +310,19 @@ def main():
             elif a == "member":
                 par.alg = Algorithms.MEMBER
                 golden_proc = learn_golden_member
+            explicit["alg"] = par.alg.name
         elif o in ("--threshold"):
             par.threshold = float(a)
         elif o == "--smoothing":
             par.smoothing = True
+            explicit["smoothing"] = True
+        elif o == "--minimize":
+            MINIMIZE = True
+            explicit["minimize"] = True
+        elif o == "--save":
+            save_file = a
+        elif o == "--load":
+            load = True
         elif o in ("-h", "--help"):
             print_help()
             sys.exit()
@@ -266,35 +337,67 @@ def main():
             sys.stderr.write("Error: bad parameters (try --help)\n")
             sys.exit(1)
 
-    if len(args) < 3:
+    if len(args) < 2 and (len(args) < 1 or save_file is None):
         sys.stderr.write("Missing input files (try --help)\n")
         sys.exit(1)
-    par.normal_file = sys.argv[1]
-    par.test_file = sys.argv[2]
+    par.normal_file = args[0]
+    par.test_file = args[1] if len(args) > 1 else None
+
+    if load:
+        try:
+            golden_map, meta = model_store.load_golden_map(par.normal_file)
+        except (OSError, ValueError, KeyError) as e:
+            sys.stderr.write("Cannot load the golden models: {0}\n".format(e))
+            sys.exit(1)
+        # windows have to be split and abstracted in the same way as the golden models
+        for key, val in (("duration", DURATION), ("abstraction", rows_filter_normal)):
+            if meta["params"].get(key) != val:
+                sys.stderr.write("Golden models were learned with a different {0}: {1} (expected {2})\n".format(key, meta["params"].get(key), val))
+                sys.exit(1)
+        for key, val in explicit.items():
+            if meta["params"][key] != val:
+                sys.stderr.write("Option {0}={1} conflicts with the golden models ({2})\n".format(key, val, meta["params"][key]))
+                sys.exit(1)
+        # windows have to be learned in the same way as the golden models
+        par.aut_type = AutType[meta["params"]["aut_type"]]
+        par.alg = Algorithms[meta["params"]["alg"]]
+        par.smoothing = meta["params"]["smoothing"]
+        MINIMIZE = meta["params"]["minimize"]
+        # re-saved models keep the origin of the golden models
+        provenance = meta["provenance"]
+        learn_proc = [learn_proc_pa, learn_proc_pta, learn_proc_ktails][par.aut_type.value]
+    learn_proc = memo.LearningCache(learn_proc, CACHE_SIZE, (MINIMIZE,))
 
     try:
-        normal_fd = open(par.normal_file, "r")
-        normal_msgs = con_par.get_messages(normal_fd)
-        test_fd = open(par.test_file, "r")
-        test_msgs = con_par.get_messages(test_fd)
-        normal_fd.close()
-        test_fd.close()
+        if not load:
+            normal_fd = open(par.normal_file, "r")
+            normal_msgs = con_par.get_messages(normal_fd)
+            normal_fd.close()
+        if par.test_file is not None:
+            test_fd = open(par.test_file, "r")
+            test_msgs = con_par.get_messages(test_fd)
+            test_fd.close()
     except FileNotFoundError:
         sys.stderr.write("Cannot open input files\n")
         sys.exit(1)
 
     if par.file_format == InputFormat.IPFIX:
-        normal_parser = con_par.IEC104Parser(normal_msgs)
-        test_parser = con_par.IEC104Parser(test_msgs)
+        parser_cls = con_par.IEC104Parser
     elif par.file_format == InputFormat.CONV:
-        normal_parser = iec_prep_par.IEC104ConvParser(normal_msgs)
-        test_parser = iec_prep_par.IEC104ConvParser(test_msgs)
+        parser_cls = iec_prep_par.IEC104ConvParser
 
-    try:
-        golden_map = golden_proc(normal_parser, learn_proc, par)
-    except KeyError as e:
-        sys.stderr.write("Missing column in the input csv: {0}\n".format(e))
-        sys.exit(1)
+    if not load:
+        try:
+            golden_map = golden_proc(parser_cls(normal_msgs), learn_proc, par)
+        except KeyError as e:
+            sys.stderr.write("Missing column in the input csv: {0}\n".format(e))
+            sys.exit(1)
+
+    if save_file is not None:
+        store_golden_map(save_file, golden_map, par, provenance)
+        if par.test_file is None:
+            return
+    test_parser = parser_cls(test_msgs)
 
     if par.alg == Algorithms.DISTR:
         anom = distr.AnomDistrComparison(golden_map, learn_proc)
@@ -311,8 +414,7 @@ def main():
 
     anomalies = defaultdict(lambda: dict())
     if (par.alg == Algorithms.DISTR) and (par.threshold is not None):
-        golden_map_member = learn_golden_member(normal_parser, learn_proc, par)
-        anom_member = mem.AnomMember(golden_map_member, learn_proc)
+        anom_member = mem.AnomMember(anom.golden_map, learn_proc)
     res = defaultdict(lambda: [])
     test_com = test_parser.split_communication_pairs()
     last = 0
@@ -329,9 +431,8 @@ def main():
             if (par.alg == Algorithms.DISTR) and (par.threshold is not None):
                 if min(r) > par.threshold:
                     ind = r.index(min(r))
-                    model = anom.golden_map[item.compair][ind]
-                    mem_det = anom_member.apply_detection(model, window.get_all_conversations(abstraction), item.compair)
-                    anomalies[item.compair][cnt] = AnomDetails(mem_det, copy.deepcopy(anom.test_fa), copy.deepcopy(anom.golden_map[item.compair][ind]))
+                    anomalies[item.compair][cnt] = AnomDetails(window.get_all_conversations(abstraction), \
+                        anom.test_fa, anom.golden_map[item.compair][ind])
             cnt += 1
 
     print("Detection results: ")
@@ -363,22 +464,30 @@ def main():
                 print("Communicating: {0}; Window: {1}".format(ent_format(ent), i))
 
                 print("Bad conversations:")
-                tmp = [k for k,v in itertools.groupby(sorted(det.bad_conv))]
+                bad_conv = anom_member.apply_detection(det.model_aut, det.window, ent)
+                tmp = [k for k,v in itertools.groupby(sorted(bad_conv))]
                 print(conv_list_format(tmp))
 
                 #aut = det.model_aut
                 #aut.__class__ = core_wfa_export.CoreWFAExport
                 #print(aut.to_dot())
 
-                print("Missing conversation:")
+                print("Missing conversations:")
                 if det.model_aut is None:
                     print("empty model")
                 else:
-                    word, pr = det.model_aut.difference_dwfa(det.test_aut).get_most_probable_string()
-                    print(conv_format(word), pr)
+                    missing = det.model_aut.difference_dwfa(det.test_aut).get_k_most_probable_strings(MISSING)
+                    if len(missing) == 0:
+                        print("none")
+                    for word, pr in missing:
+                        print(conv_format(word), pr)
 
                 print()
 
+    print("\nLearning cache: {0}".format(learn_proc.summary()))
+    if MINIMIZE:
+        print("Minimization: states {0} -> {1}".format(minimized_states[0], minimized_states[1]))
+
 
 if __name__ == "__main__":
     main()
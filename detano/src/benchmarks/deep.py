@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of learning from deep synthetic conversations resembling IEC 104
+file transfers (asduType 120--127) (run from src as python3 -m benchmarks.deep
+[conversation length] [number of conversations]).
+
+Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License.
+If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+import random
+
+import anomaly_check as ac
+import learning.fpt as fpt
+
+## Length of the longest conversation
+LENGTH = 2000
+## Number of conversations
+CONVERSATIONS = 20
+## Seed of the generator of conversations
+SEED = 0
+
+
+"""
+Generate file-transfer-like conversations (select file, sections and segments
+of varying lengths, last segment and acknowledgement)
+"""
+def file_transfers(length, count, rnd):
+    ret = list()
+    for _ in range(count):
+        conv = [("122", "13"), ("120", "13")]
+        target = rnd.randint(length // 2, length) - 2
+        while len(conv) < target:
+            conv.append(("125", rnd.choice(["5", "13"])))
+            if rnd.random() < 0.05:
+                conv.append(("123", "13"))
+        conv += [("123", "13"), ("124", "13")]
+        ret.append(conv)
+    return ret
+
+
+def main():
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else LENGTH
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else CONVERSATIONS
+    training = file_transfers(length, count, random.Random(SEED))
+
+    print("learner;conversations;max length;time [s];states")
+    for name, proc in [("pta", ac.learn_proc_pta), ("alergia", ac.learn_proc_pa), ("ktails", ac.learn_proc_ktails)]:
+        start = time.perf_counter()
+        fa = proc(training)
+        elapsed = time.perf_counter() - start
+        print("{0};{1};{2};{3:.3f};{4}".format(name, len(training), max(map(len, training)), \
+            elapsed, len(fa.get_states())))
+
+    # deep folding: a successor of the state after selecting the file (its
+    # subtree consists of the whole transfers) is folded into the state
+    tree = fpt.FPT()
+    tree.add_string_list(training)
+    red = tree.get_root()
+    for _ in range(2):
+        red = next(iter(tree.successors(red)))
+    start = time.perf_counter()
+    tree.stochastic_merge(red, next(iter(tree.successors(red))))
+    tree.trim()
+    elapsed = time.perf_counter() - start
+    print("{0};{1};{2};{3:.3f};{4}".format("fold", len(training), max(map(len, training)), \
+        elapsed, len(tree.get_states())))
+
+
+if __name__ == "__main__":
+    main()
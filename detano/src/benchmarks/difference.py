@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of difference automata (used for reporting missing conversations)
+of PAs learned from windows with large alphabets: explicit completion of the
+second automaton vs the implicit trap state (run from src as python3 -m
+benchmarks.difference [alphabet size] [number of conversations]).
+
+Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License.
+If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import copy
+import time
+import random
+
+import anomaly_check as ac
+
+## Number of symbols (pairs asduType, cot)
+ALPHABET = 200
+## Number of conversations in a window
+CONVERSATIONS = 300
+## Length of the longest conversation
+LENGTH = 6
+## Seed of the generator of conversations
+SEED = 0
+
+
+"""
+Generate a window of conversations over the given number of symbols
+"""
+def window(symbols, count, rnd):
+    alph = [(str(i // 4), str(i % 4 + 3)) for i in range(symbols)]
+    return [[rnd.choice(alph) for _ in range(rnd.randint(1, LENGTH))] for _ in range(count)]
+
+
+"""
+Difference automaton with the explicitly completed second automaton
+"""
+def difference_completion(aut, diff):
+    but = copy.deepcopy(diff)
+    but.set_alphabet(list(set(but.get_alphabet() + aut.get_alphabet())))
+    but.complete_wfa(-1)
+    but.set_ones()
+    but.set_finals({st: 1.0 for st in but.get_states() if st not in but.get_finals()})
+    return aut.product(but).get_trim_automaton()
+
+
+def main():
+    symbols = int(sys.argv[1]) if len(sys.argv) > 1 else ALPHABET
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else CONVERSATIONS
+    rnd = random.Random(SEED)
+    model = ac.learn_proc_pa(window(symbols, count, rnd))
+    test = ac.learn_proc_pa(window(symbols, count, rnd))
+
+    print("method;alphabet;model states;test states;time [s];difference states")
+    for name, proc in [("completion", difference_completion), ("implicit", lambda a, b: a.difference_dwfa(b))]:
+        start = time.perf_counter()
+        diff = proc(model, test)
+        elapsed = time.perf_counter() - start
+        print("{0};{1};{2};{3};{4:.3f};{5}".format(name, symbols, len(model.get_states()), \
+            len(test.get_states()), elapsed, len(diff.get_states())))
+
+
+if __name__ == "__main__":
+    main()
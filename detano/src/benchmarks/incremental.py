@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark comparing a full rebuild of a PA with the incremental learning when
+new conversations arrive (run from src as python3 -m benchmarks.incremental
+<csv file> [number of chunks]).
+
+Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License.
+If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+
+import pa_learning
+import learning.incremental as incremental
+import parser.IEC104_parser as con_par
+
+## Number of chunks of the training data (e.g., days of traffic)
+CHUNKS = 5
+## Part of conversations used for training
+TRAINING = 0.8
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.stderr.write("Usage: python3 -m benchmarks.incremental <csv file> [number of chunks]\n")
+        sys.exit(1)
+    chunks = int(sys.argv[2]) if len(sys.argv) > 2 else CHUNKS
+
+    with open(sys.argv[1], "r") as fd:
+        parser = con_par.IEC104Parser(con_par.get_messages(fd))
+    parser.parse_conversations()
+    lines = parser.get_all_conversations(pa_learning.abstraction)
+    index = int(len(lines)*TRAINING)
+    training, testing = lines[:index], lines[index:]
+
+    size = max(1, len(training) // chunks)
+    learner = incremental.IncrementalAlergia(pa_learning.ALPHA)
+    print("chunk;conversations;full time [s];incremental time [s];full states;incremental states;full miss;incremental miss")
+    for i in range(chunks):
+        new = training[i*size:] if i == chunks - 1 else training[i*size:(i+1)*size]
+        seen = training[:i*size + len(new)]
+
+        start = time.perf_counter()
+        fa_full, _, _ = pa_learning.learn_pa(seen)
+        full_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        learner.add_conversations(new)
+        fa_inc = learner.get_automaton()
+        inc_time = time.perf_counter() - start
+
+        print("{0};{1};{2:.3f};{3:.3f};{4};{5};{6};{7}".format(i, len(seen), full_time, inc_time, \
+            len(fa_full.get_states()), len(fa_inc.get_states()), \
+            pa_learning.count_miss(fa_full, testing), pa_learning.count_miss(fa_inc, testing)))
+
+
+if __name__ == "__main__":
+    main()
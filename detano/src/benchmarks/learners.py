@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark comparing learning time and detection results of Alergia and k-tails
+on the same windows (run from src as python3 -m benchmarks.learners <valid
+traffic csv> <inspected csv>).
+
+Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License.
+If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+
+import anomaly_check as ac
+import parser.IEC104_parser as con_par
+import detection.distr_comparison as distr
+import detection.member as mem
+
+## Distance from which a window is considered to be anomalous
+THRESHOLD = 0.1
+
+LEARNERS = [("alergia", ac.learn_proc_pa), ("ktails", ac.learn_proc_ktails)]
+
+
+"""
+Learn golden automata and run both detections on all test windows
+"""
+def evaluate(learn_proc, normal_msgs, test_msgs):
+    par = ac.Params(ac.Algorithms.DISTR, None, None, None, None, True, ac.InputFormat.IPFIX, None)
+
+    start = time.perf_counter()
+    golden = ac.learn_golden_distr(con_par.IEC104Parser(normal_msgs), learn_proc, par)
+    golden_member = ac.learn_golden_member(con_par.IEC104Parser(normal_msgs), learn_proc, par)
+    learn_time = time.perf_counter() - start
+
+    auts = [fa for v in golden.values() for fa in v if fa is not None]
+    states = sum(len(fa.get_states()) for fa in auts) / float(max(1, len(auts)))
+
+    anom = distr.AnomDistrComparison(golden, learn_proc)
+    anom_member = mem.AnomMember(golden_member, learn_proc)
+    dists = dict()
+    rejected = 0
+    start = time.perf_counter()
+    for item in con_par.IEC104Parser(test_msgs).split_communication_pairs():
+        for i, window in enumerate(item.split_to_windows(ac.DURATION)):
+            window.parse_conversations()
+            convs = window.get_all_conversations(ac.abstraction)
+            dists[(item.compair, i)] = min(anom.detect(convs, item.compair))
+            rejected += sum(len(r) for r in anom_member.detect(convs, item.compair))
+    detect_time = time.perf_counter() - start
+
+    return learn_time, detect_time, states, dists, rejected
+
+
+def main():
+    if len(sys.argv) < 3:
+        sys.stderr.write("Usage: python3 -m benchmarks.learners <valid traffic csv> <inspected csv>\n")
+        sys.exit(1)
+
+    with open(sys.argv[1], "r") as fd:
+        normal_msgs = con_par.get_messages(fd)
+    with open(sys.argv[2], "r") as fd:
+        test_msgs = con_par.get_messages(fd)
+
+    res = dict()
+    print("learner;learning time [s];detection time [s];avg states;mean distance;anomalous windows;rejected conversations")
+    for name, proc in LEARNERS:
+        learn_time, detect_time, states, dists, rejected = evaluate(proc, normal_msgs, test_msgs)
+        res[name] = dists
+        vals = list(dists.values())
+        mean = sum(vals) / float(max(1, len(vals)))
+        anomalous = len([v for v in vals if v > THRESHOLD])
+        print("{0};{1:.3f};{2:.3f};{3:.1f};{4:.4f};{5}/{6};{7}".format(name, learn_time, \
+            detect_time, states, mean, anomalous, len(vals), rejected))
+
+    ref = res[LEARNERS[0][0]]
+    for name, _ in LEARNERS[1:]:
+        dists = res[name]
+        agree = len([k for k in ref if (ref[k] > THRESHOLD) == (dists[k] > THRESHOLD)])
+        print("Agreement with {0} ({1}): {2}/{3} windows".format(LEARNERS[0][0], name, agree, len(ref)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the minimization of learned PAs and PTAs (merging
+probabilistically bisimilar states): numbers of states and end-to-end
+distribution-based detection time with and without the minimization (run from
+src as python3 -m benchmarks.minimize <valid traffic csv> <inspected csv>).
+
+Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License.
+If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+
+import anomaly_check as ac
+import parser.IEC104_parser as con_par
+import detection.distr_comparison as distr
+
+LEARNERS = [("pta", ac.learn_proc_pta), ("alergia", ac.learn_proc_pa)]
+
+
+"""
+Learn golden automata (with smoothing) and compute distances of all test
+windows
+"""
+def evaluate(learn_proc, normal_msgs, test_msgs):
+    par = ac.Params(ac.Algorithms.DISTR, None, None, None, None, True, ac.InputFormat.IPFIX, None)
+
+    start = time.perf_counter()
+    golden = ac.learn_golden_distr(con_par.IEC104Parser(normal_msgs), learn_proc, par)
+    learn_time = time.perf_counter() - start
+    states = sum(len(fa.get_states()) for v in golden.values() for fa in v if fa is not None)
+
+    anom = distr.AnomDistrComparison(golden, learn_proc)
+    anom.remove_identical()
+    dists = dict()
+    start = time.perf_counter()
+    for item in con_par.IEC104Parser(test_msgs).split_communication_pairs():
+        for i, window in enumerate(item.split_to_windows(ac.DURATION)):
+            window.parse_conversations()
+            dists[(item.compair, i)] = min(anom.detect(window.get_all_conversations(ac.abstraction), item.compair))
+    return learn_time, time.perf_counter() - start, states, dists
+
+
+def main():
+    if len(sys.argv) < 3:
+        sys.stderr.write("Usage: python3 -m benchmarks.minimize <valid traffic csv> <inspected csv>\n")
+        sys.exit(1)
+
+    with open(sys.argv[1], "r") as fd:
+        normal_msgs = con_par.get_messages(fd)
+    with open(sys.argv[2], "r") as fd:
+        test_msgs = con_par.get_messages(fd)
+
+    print("learner;minimize;states;learning time [s];detection time [s];total time [s];max distance difference")
+    for name, proc in LEARNERS:
+        res = dict()
+        for minimize in [False, True]:
+            ac.MINIMIZE = minimize
+            learn_time, detect_time, states, dists = evaluate(proc, normal_msgs, test_msgs)
+            res[minimize] = dists
+            diff = max([abs(dists[k] - res[False][k]) for k in dists] + [0.0])
+            print("{0};{1};{2};{3:.3f};{4:.3f};{5:.3f};{6:.2e}".format(name, minimize, states, \
+                learn_time, detect_time, learn_time + detect_time, diff))
+        ac.MINIMIZE = False
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark comparing scoring of conversations by a learned PA: one by one,
+batched (shared prefixes) and vectorized over arrays of encoded conversations
+(run from src as python3 -m benchmarks.scoring <csv file>).
+
+Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License.
+If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sys
+import time
+
+import pa_learning
+import parser.IEC104_parser as con_par
+
+## Part of conversations used for training
+TRAINING = 0.33
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.stderr.write("Usage: python3 -m benchmarks.scoring <csv file>\n")
+        sys.exit(1)
+
+    with open(sys.argv[1], "r") as fd:
+        parser = con_par.IEC104Parser(con_par.get_messages(fd))
+    parser.parse_conversations()
+    lines = parser.get_all_conversations(pa_learning.abstraction)
+    fa, _, _ = pa_learning.learn_pa(lines[:int(len(lines)*TRAINING)])
+    dpa = fa.get_compiled_dpa()
+
+    print("method;conversations;time [s];rejected")
+    start = time.perf_counter()
+    res = [fa.string_prob_deterministic(line) for line in lines]
+    print("single;{0};{1:.3f};{2}".format(len(lines), time.perf_counter() - start, res.count(None)))
+
+    start = time.perf_counter()
+    res = fa.score_batch(lines)
+    print("batch;{0};{1:.3f};{2}".format(len(lines), time.perf_counter() - start, res.count(None)))
+
+    offsets, values = dpa.encode(lines)
+    start = time.perf_counter()
+    _, rejected = dpa.score_ragged(offsets, values)
+    print("ragged;{0};{1:.3f};{2}".format(len(lines), time.perf_counter() - start, rejected.sum()))
+
+    codes, lengths = dpa.encode(lines, padded=True)
+    start = time.perf_counter()
+    _, rejected = dpa.score_padded(codes, lengths)
+    print("padded;{0};{1:.3f};{2}".format(len(lines), time.perf_counter() - start, rejected.sum()))
+
+
+if __name__ == "__main__":
+    main()
@@ -33,7 +33,7 @@ import wfa.matrix_wfa as matrix_wfa
 import algorithms.distance as dist
 import wfa.core_wfa as core_wfa
 
-from typing import Callable, List, no_type_check
+from typing import Callable, List, Optional, no_type_check
 
 ## Use sparse matrices to comput the Euclid distance
 SPARSE = False
@@ -100,10 +100,20 @@ class AnomDistrComparison(anom.AnomDetectBase):
 
     def remove_identical(self) -> None:
         """!
-        Remove identical automata from the golden map
+        Remove identical automata (having the same fingerprint, see
+        CoreWFA.get_fingerprint) from the golden map. Identical automata of
+        different communication pairs are replaced by a single shared automaton.
         """
+        shared: dict[Optional[str], Optional[core_wfa.CoreWFA]] = dict()
         for k, v in self.golden_map.items():
-            self.golden_map[k] = list(set(v))
+            lst = list()
+            seen = set()
+            for aut in v:
+                fp = None if aut is None else aut.get_fingerprint()
+                if fp not in seen:
+                    seen.add(fp)
+                    lst.append(shared.setdefault(fp, aut))
+            self.golden_map[k] = lst
 
 
     def remove_euclid_similar(self, max_error: float) -> None:
@@ -156,23 +166,14 @@ class AnomDistrComparison(anom.AnomDetectBase):
             ((len(aut1.get_transitions()) == 0 and len(aut2.get_transitions()) > 0)):
             return 1.0
 
-        pr1 = aut1.product(aut1).get_trim_automaton()
-        pr2 = aut1.product(aut2).get_trim_automaton()
-        pr3 = aut2.product(aut2).get_trim_automaton()
-
-        pr1.rename_states()
-        pr2.rename_states()
-        pr3.rename_states()
-
-        pr1.__class__ = matrix_wfa.MatrixWFA
-        pr2.__class__ = matrix_wfa.MatrixWFA
-        pr3.__class__ = matrix_wfa.MatrixWFA
-
         try:
-            res1 = pr1.compute_language_probability(matrix_wfa.ClosureMode.inverse, SPARSE)
-            res2 = pr2.compute_language_probability(matrix_wfa.ClosureMode.inverse, SPARSE)
-            res3 = pr3.compute_language_probability(matrix_wfa.ClosureMode.inverse, SPARSE)
+            res1 = matrix_wfa.MatrixWFA.inner_product(aut1, aut1)
+            res2 = matrix_wfa.MatrixWFA.inner_product(aut1, aut2)
+            res3 = matrix_wfa.MatrixWFA.inner_product(aut2, aut2)
         except ValueError:
+            pr1 = matrix_wfa.MatrixWFA.from_product(aut1, aut1, trim=True)
+            pr2 = matrix_wfa.MatrixWFA.from_product(aut1, aut2, trim=True)
+            pr3 = matrix_wfa.MatrixWFA.from_product(aut2, aut2, trim=True)
             res1 = pr1.compute_language_probability(matrix_wfa.ClosureMode.iterations, SPARSE, 20)
             res2 = pr2.compute_language_probability(matrix_wfa.ClosureMode.iterations, SPARSE, 20)
             res3 = pr3.compute_language_probability(matrix_wfa.ClosureMode.iterations, SPARSE, 20)
@@ -96,10 +96,5 @@ class AnomMember(anom.AnomDetectBase):
         if aut is None:
             return window
 
-        ret = []
-        for conv in window:
-            prob = aut.string_prob_deterministic(conv)
-            if prob is None:
-                ret.append(conv)
-
-        return ret
+        probs = aut.score_batch(window)
+        return [conv for conv, prob in zip(window, probs) if prob is None]
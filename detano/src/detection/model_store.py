@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""!
+\brief Binary store of golden models
+
+\details
+    Saving and loading of golden maps (communication pairs -> lists of
+    automata) in the NumPy .npz format (without pickled objects). Identical
+    automata (having the same fingerprint) are stored once. Transitions of all
+    stored automata are concatenated into parallel arrays (source,
+    destination, symbol id, weight) with offsets per automaton; symbols are
+    stored in a single symbol table. Symbols and communication pairs are stored
+    as Python literals (repr), learner parameters and provenance as JSON.
+
+\author Vojtěch Havlena
+
+\copyright
+    Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>\n
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.\n
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.\n
+    You should have received a copy of the GNU General Public License.
+    If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import ast
+import json
+import numpy
+from collections import defaultdict
+
+import detection.anom_detect_base as anom
+import wfa.array_wfa as array_wfa
+import wfa.core_wfa as core_wfa
+import wfa.core_wfa_export as core_wfa_export
+
+from typing import Any, List, Optional, Tuple
+
+## Version of the format
+VERSION = 1
+
+
+def save_golden_map(path: str, golden_map: dict[anom.ComPairType, List[Optional[core_wfa.CoreWFA]]], params: dict[str, Any], provenance: dict[str, Any]) -> None:
+    """!
+    Save a golden map to a binary file (.npz). States of the stored automata
+    are renumbered (initial states first).
+
+    @param path: Output file
+    @param golden_map: Mapping of communication pairs to lists of automata
+    @param params: Parameters of the learning (JSON serializable)
+    @param provenance: Origin of the models (JSON serializable)
+    """
+    symbols: dict[Any, int] = dict()
+    index: dict[str, int] = dict()
+    auts: List[core_wfa.CoreWFA] = []
+    pairs, models, pair_offsets = [], [], [0]
+    for compair, lst in golden_map.items():
+        pairs.append(repr(sorted(compair)))
+        for aut in lst:
+            if aut is None:
+                models.append(-1)
+                continue
+            fp = aut.get_fingerprint()
+            if fp not in index:
+                index[fp] = len(auts)
+                auts.append(aut)
+            models.append(index[fp])
+        pair_offsets.append(len(models))
+
+    src, dest, sym, weight, finals, starts, alphabet = [], [], [], [], [], [], []
+    trans_offsets, state_offsets, alph_offsets = [0], [0], [0]
+    for aut in auts:
+        arr = array_wfa.ArrayWFA.from_wfa(aut)
+        ids = numpy.array([symbols.setdefault(s, len(symbols)) for s in arr.symbols], dtype=numpy.int64)
+        src.append(arr.src)
+        dest.append(arr.dest)
+        sym.append(ids[arr.sym])
+        weight.append(arr.weight)
+        finals.append(arr.finals)
+        starts.append(arr.starts)
+        alphabet.append(numpy.array([symbols[s] for s in aut.get_alphabet()], dtype=numpy.int64))
+        trans_offsets.append(trans_offsets[-1] + len(arr.src))
+        state_offsets.append(state_offsets[-1] + arr.get_state_count())
+        alph_offsets.append(alph_offsets[-1] + len(alphabet[-1]))
+
+    def concat(lst, dtype):
+        return numpy.concatenate(lst).astype(dtype) if len(lst) > 0 else numpy.zeros(0, dtype=dtype)
+
+    meta = {"version": VERSION, "params": params, "provenance": provenance, \
+        "automata": len(models), "unique_automata": len(auts)}
+    with open(path, "wb") as fd:
+        numpy.savez_compressed(fd, meta=numpy.array(json.dumps(meta)), \
+            symbols=numpy.array([repr(s) for s in symbols], dtype=str), \
+            pairs=numpy.array(pairs, dtype=str), \
+            pair_offsets=numpy.array(pair_offsets, dtype=numpy.int64), \
+            models=numpy.array(models, dtype=numpy.int64), \
+            trans_offsets=numpy.array(trans_offsets, dtype=numpy.int64), \
+            src=concat(src, numpy.int64), dest=concat(dest, numpy.int64), \
+            sym=concat(sym, numpy.int64), weight=concat(weight, numpy.float64), \
+            state_offsets=numpy.array(state_offsets, dtype=numpy.int64), \
+            finals=concat(finals, numpy.float64), starts=concat(starts, numpy.float64), \
+            alph_offsets=numpy.array(alph_offsets, dtype=numpy.int64), \
+            alphabet=concat(alphabet, numpy.int64))
+
+
+def load_golden_map(path: str) -> Tuple[dict[anom.ComPairType, List[Optional[core_wfa.CoreWFA]]], dict[str, Any]]:
+    """!
+    Load a golden map from a binary file (see save_golden_map). Loaded
+    automata are frozen (identical automata are shared).
+
+    @param path: Input file
+
+    @return Pair (golden map, metadata containing params and provenance)
+    """
+    with numpy.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data["meta"]))
+        if meta.get("version") != VERSION:
+            raise ValueError("Unsupported version of the model store: {0}".format(meta.get("version")))
+        symbols = [ast.literal_eval(s) for s in data["symbols"].tolist()]
+        trans_offsets = data["trans_offsets"].tolist()
+        state_offsets = data["state_offsets"].tolist()
+        alph_offsets = data["alph_offsets"].tolist()
+        src, dest, sym, weight = data["src"], data["dest"], data["sym"], data["weight"]
+        finals, starts, alphabet = data["finals"], data["starts"], data["alphabet"].tolist()
+
+        auts: List[core_wfa.CoreWFA] = []
+        for i in range(len(trans_offsets) - 1):
+            tr = slice(trans_offsets[i], trans_offsets[i+1])
+            st = slice(state_offsets[i], state_offsets[i+1])
+            arr = array_wfa.ArrayWFA(list(range(state_offsets[i+1] - state_offsets[i])), symbols, \
+                src[tr], dest[tr], sym[tr], weight[tr], finals[st], starts[st])
+            aut = arr.to_wfa(core_wfa_export.CoreWFAExport, labels=False)
+            aut.set_alphabet([symbols[j] for j in alphabet[alph_offsets[i]:alph_offsets[i+1]]])
+            auts.append(aut.freeze())
+
+        golden_map: dict[anom.ComPairType, List[Optional[core_wfa.CoreWFA]]] = defaultdict(lambda: [None])
+        pair_offsets = data["pair_offsets"].tolist()
+        models = data["models"].tolist()
+        for i, pair in enumerate(data["pairs"].tolist()):
+            compair = frozenset(ast.literal_eval(pair))
+            golden_map[compair] = [auts[j] if j >= 0 else None for j in models[pair_offsets[i]:pair_offsets[i+1]]]
+    return golden_map, meta
@@ -25,43 +25,256 @@
 
 import sys
 import math
+import heapq
+import bisect
+import numpy
 import learning.fpt as fpt
 import learning.dffa as dffa
 import learning.ffa as ffa
 
-from typing import Set, Optional
+from typing import Set, List, Optional, Any
 
-def choose_blue_state(freq_aut: dffa.DFFA, blue_set: Set[ffa.StateType], t0: int) -> Optional[ffa.StateType]:
+class RedBlueFrontier:
     """!
-    Chose a blue state from a set of blue states.
+    Red and blue states of the state merging maintained incrementally. Blue
+    states are kept in a heap ordered in the same way as sorted(), so the
+    chosen states are the same as if the whole sets were sorted in each step.
+    """
 
-    @param freq_aut: Frequency automaton
-    @param blue_set: Set of blue states
-    @param t0: The minimum number of strings for merging a state
+    def __init__(self, freq_aut: dffa.DFFA, t0: int, reds: Optional[Set[ffa.StateType]] = None):
+        """!
+        Constructor
 
-    @return Chosen blue state
-    """
-    for bl in sorted(blue_set):
-        if freq_aut.state_freq(bl) >= t0:
+        @param freq_aut: Frequency automaton
+        @param t0: The minimum number of strings for merging a state
+        @param reds: Initial red states (only the root if not given)
+        """
+        self.freq_aut = freq_aut
+        self.t0 = t0
+        if reds is None:
+            reds = set([freq_aut.get_root()])
+        ## Red states (in the sorted order)
+        self.red_list: List[ffa.StateType] = sorted(reds)
+        self.red_set: Set[ffa.StateType] = set(reds)
+        ## All blue states
+        self.blue_set: Set[ffa.StateType] = set()
+        ## Transitions leading to blue states (from red states)
+        self.blue_preds: dict[ffa.StateType, ffa.FFATrans] = dict()
+        ## Heap of blue candidates (may contain removed states)
+        self.blue_heap: List[ffa.StateType] = []
+        ## Blue states whose frequency is below t0
+        self.deferred: Set[ffa.StateType] = set()
+        for red in self.red_list:
+            self._add_successors(red)
+
+
+    def _add_successors(self, state: ffa.StateType) -> None:
+        """!
+        Add successors of a red state to the blue states.
+
+        @param state: Red state
+        """
+        for _, tr in self.freq_aut.get_transitions()[state].items():
+            succ = tr.dest
+            if succ in self.red_set:
+                continue
+            self.blue_preds[succ] = tr
+            if succ not in self.blue_set:
+                self.blue_set.add(succ)
+                heapq.heappush(self.blue_heap, succ)
+
+
+    def choose_blue(self) -> Optional[ffa.StateType]:
+        """!
+        Chose the least blue state having the frequency at least t0.
+
+        @return Chosen blue state
+        """
+        while self.blue_heap:
+            bl = self.blue_heap[0]
+            if bl not in self.blue_set or bl in self.deferred:
+                heapq.heappop(self.blue_heap)
+                continue
+            if self.freq_aut.state_freq(bl) < self.t0:
+                heapq.heappop(self.blue_heap)
+                self.deferred.add(bl)
+                continue
             return bl
-    return None
+        return None
 
 
-def choose_red_state(freq_aut: dffa.DFFA, red_set: Set[ffa.StateType], blue: ffa.StateType, alpha: float) -> Optional[ffa.StateType]:
-    """!
-    Chose a red state from a set of red states.
+    def _red_added(self, state: ffa.StateType, ind: int) -> None:
+        """!
+        Hook called after a new red state is inserted to red_list.
 
-    @param freq_aut: Frequency automaton
-    @param red_set: Set of red states
-    @param blue: Blue state
-    @param alpha: Merging parameter
+        @param state: New red state
+        @param ind: Position of the state in red_list
+        """
+        pass
+
+
+    def _red_changed(self, state: ffa.StateType) -> None:
+        """!
+        Hook called after frequencies of a red state are changed by a merge.
 
-    @return Chosen red state
+        @param state: Red state
+        """
+        pass
+
+
+    def promote(self, blue: ffa.StateType) -> None:
+        """!
+        Change a blue state to red.
+
+        @param blue: Blue state
+        """
+        self.blue_set.discard(blue)
+        self.blue_preds.pop(blue, None)
+        ind = bisect.bisect(self.red_list, blue)
+        self.red_list.insert(ind, blue)
+        self.red_set.add(blue)
+        self._red_added(blue, ind)
+        self._add_successors(blue)
+
+
+    def merge(self, red: ffa.StateType, blue: ffa.StateType) -> None:
+        """!
+        Merge the blue state into the red state (including removing the folded
+        subtree) and update the frontier.
+
+        @param red: Red state
+        @param blue: Blue state
+        """
+        touched: Set[ffa.StateType] = set()
+        folded: Set[ffa.StateType] = set()
+        self.freq_aut.stochastic_merge(red, blue, touched, folded, self.blue_preds.pop(blue))
+        self.freq_aut.remove_states(folded)
+
+        self.blue_set.discard(blue)
+        for st in touched:
+            if st in self.red_set:
+                self._red_changed(st)
+                self._add_successors(st)
+            elif st in self.deferred:
+                self.deferred.discard(st)
+                heapq.heappush(self.blue_heap, st)
+
+
+class AlergiaFrontier(RedBlueFrontier):
+    """!
+    Red and blue states of the Alergia algorithm. Frequencies of red states are
+    kept in a matrix (one row per red state, the first column are final
+    frequencies, the remaining columns are frequencies of outgoing transitions
+    over the interned alphabet), which allows to test a blue state against all
+    red states at once. Rows are appended in the order of promotion to
+    preallocated arrays (doubled when full).
     """
-    for red in sorted(red_set):
-        if freq_aut.alergia_compatible(red, blue, alpha):
-            return red
-    return None
+
+    def __init__(self, freq_aut: dffa.DFFA, t0: int, reds: Optional[Set[ffa.StateType]] = None):
+        """!
+        Constructor
+
+        @param freq_aut: Frequency automaton
+        @param t0: The minimum number of strings for merging a state
+        @param reds: Initial red states (only the root if not given)
+        """
+        super(AlergiaFrontier, self).__init__(freq_aut, t0, reds)
+        ## Interned alphabet (symbol -> column of the frequency matrix)
+        self.symbols: dict[Any, int] = dict()
+        for _, sym_dct in freq_aut.get_transitions().items():
+            for sym in sym_dct.keys():
+                self.symbols.setdefault(sym, len(self.symbols) + 1)
+        ## Red states in the order of rows of the frequency matrix
+        self.red_rows: List[ffa.StateType] = list(self.red_list)
+        ## Rows of red states in the frequency matrix
+        self.red_index: dict[ffa.StateType, int] = dict([(red, i) for i, red in enumerate(self.red_rows)])
+        size = max(2*len(self.red_rows), 16)
+        ## Frequencies of red states (only the first len(red_rows) rows are used)
+        self.red_freqs = numpy.zeros((size, len(self.symbols) + 1))
+        for i, red in enumerate(self.red_rows):
+            self.red_freqs[i] = self._state_freqs(red)
+        ## Total frequencies of red states
+        self.red_totals = self.red_freqs.sum(axis=1)
+        ## Hoeffding bound terms sqrt(1/n) of red states (0 for empty states)
+        self.red_bounds = AlergiaFrontier._bound(self.red_totals)
+
+
+    @staticmethod
+    def _bound(totals: numpy.ndarray) -> numpy.ndarray:
+        """!
+        Get Hoeffding bound terms sqrt(1/n) (states with zero frequency, e.g.,
+        the root of an empty tree, get 0).
+
+        @param totals: Total frequencies of states
+
+        @return Bound terms
+        """
+        return numpy.sqrt(numpy.divide(1.0, totals, out=numpy.zeros(len(totals)), where=totals > 0))
+
+
+    def _state_freqs(self, state: ffa.StateType) -> numpy.ndarray:
+        """!
+        Get frequencies of a state as a vector over the interned alphabet.
+
+        @param state: State
+
+        @return Vector of the final frequency followed by frequencies of outgoing transitions
+        """
+        row = numpy.zeros(len(self.symbols) + 1)
+        row[0] = self.freq_aut.get_finals()[state]
+        for sym, tr in self.freq_aut.get_transitions()[state].items():
+            row[self.symbols[sym]] = tr.weight
+        return row
+
+
+    def _red_added(self, state: ffa.StateType, ind: int) -> None:
+        """!
+        Insert frequencies of a new red state.
+
+        @param state: New red state
+        @param ind: Position of the state in red_list
+        """
+        num = len(self.red_rows)
+        if num == len(self.red_freqs):
+            self.red_freqs = numpy.concatenate((self.red_freqs, numpy.zeros(self.red_freqs.shape)))
+            self.red_totals = numpy.concatenate((self.red_totals, numpy.zeros(num)))
+            self.red_bounds = numpy.concatenate((self.red_bounds, numpy.zeros(num)))
+        self.red_rows.append(state)
+        self.red_index[state] = num
+        self._red_changed(state)
+
+
+    def _red_changed(self, state: ffa.StateType) -> None:
+        """!
+        Update frequencies of a red state.
+
+        @param state: Red state
+        """
+        ind = self.red_index[state]
+        self.red_freqs[ind] = self._state_freqs(state)
+        self.red_totals[ind] = self.red_freqs[ind].sum()
+        self.red_bounds[ind] = math.sqrt(1.0 / self.red_totals[ind]) if self.red_totals[ind] > 0 else 0.0
+
+
+    def choose_red(self, blue: ffa.StateType, alpha: float) -> Optional[ffa.StateType]:
+        """!
+        Chose the least red state compatible with the blue state. All red
+        states are tested at once (the same test as DFFA.alergia_compatible).
+
+        @param blue: Blue state
+        @param alpha: Merging parameter
+
+        @return Chosen red state
+        """
+        num = len(self.red_rows)
+        row = self._state_freqs(blue)
+        total = row.sum()
+        gamma = numpy.abs(self.red_freqs[:num] / self.red_totals[:num, numpy.newaxis] - row / total)
+        bound = (self.red_bounds[:num] + math.sqrt(1.0 / total)) * dffa.DFFA.hoeffding_factor(alpha)
+        compatible = numpy.flatnonzero(numpy.all(gamma < bound[:, numpy.newaxis], axis=1))
+        if len(compatible) == 0:
+            return None
+        return min([self.red_rows[i] for i in compatible.tolist()])
 
 
 def alergia(freq_aut: dffa.DFFA, alpha: float, t0: int) -> dffa.DFFA:
@@ -75,21 +288,26 @@ def alergia(freq_aut: dffa.DFFA, alpha: float, t0: int) -> dffa.DFFA:
     @return Compact frequency automaton (no normalization applied)
     """
     freq_aut.get_states()
-    red_set = set([freq_aut.get_root()])
-    blue_set = freq_aut.successors(freq_aut.get_root())
+    alergia_frontier(AlergiaFrontier(freq_aut, t0), alpha)
+    return freq_aut
+
 
-    blue = choose_blue_state(freq_aut, blue_set, t0)
+def alergia_frontier(frontier: AlergiaFrontier, alpha: float) -> None:
+    """!
+    Run the Alergia merging from a given frontier (until there is no blue state
+    to be processed). The frontier can contain red states decided in a previous
+    run of the algorithm.
+
+    @param frontier: Red and blue states of the frequency automaton
+    @param alpha: Merging parameter
+    """
+    blue = frontier.choose_blue()
     while blue is not None:
-        red = choose_red_state(freq_aut, red_set, blue, alpha)
+        red = frontier.choose_red(blue, alpha)
 
         if red is not None:
-            freq_aut.stochastic_merge(red, blue)
-            freq_aut.trim()
+            frontier.merge(red, blue)
         else:
-            red_set.add(blue)
+            frontier.promote(blue)
 
-        blue_set = freq_aut.successors_set(red_set) - red_set
-        blue = choose_blue_state(freq_aut, blue_set, t0)
-
-
-    return freq_aut
+        blue = frontier.choose_blue()
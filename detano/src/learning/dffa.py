@@ -23,10 +23,12 @@
 
 import math
 from collections import defaultdict
-from typing import List, Set, Union, Optional, Tuple, no_type_check
+from typing import List, Set, Union, Optional, Tuple, Callable, Iterator, no_type_check
 
 import learning.ffa as ffa
+import wfa.core_wfa as core_wfa
 import wfa.core_wfa_export as core_wfa_export
+import wfa.array_dpa as array_dpa
 
 class DFFA(ffa.FFA):
     """!
@@ -62,6 +64,60 @@ class DFFA(ffa.FFA):
         return self._root
 
 
+    def copy(self) -> "DFFA":
+        """!
+        Get a snapshot of the DFFA that can be modified (e.g., by state merging)
+        independently of the original one. Only transitions and frequencies are
+        copied, states are shared as immutable labels.
+
+        @return Copy of the DFFA
+        """
+        trans: ffa.TransFuncDetType = defaultdict(lambda: dict())
+        for src, sym_dct in self._trans.items():
+            trans[src] = { sym: ffa.FFATrans(tr.src, tr.dest, tr.weight, tr.symbol, tr.label) \
+                for sym, tr in sym_dct.items() }
+        ini: ffa.StateWeightType = defaultdict(lambda: 0, self._ini)
+        fin: ffa.StateWeightType = defaultdict(lambda: 0, self._fin)
+        return DFFA(set(self._states), trans, ini, fin, self._root)
+
+
+    def add_frequencies(self, string: List, fresh: Callable[[], ffa.StateType]) -> None:
+        """!
+        Add frequencies of a string to the DFFA. If the string leaves the
+        automaton, a new branch (a prefix tree) is created for the rest of the
+        string.
+
+        @param string: String to be added
+        @param fresh: Function returning a new (unused) state
+        """
+        act = self._root
+        self._ini[act] += 1
+        rest: List = []
+        for i in range(len(string)):
+            tr = self._trans[act].get(string[i], None)
+            if tr is None:
+                rest = string[i:]
+                break
+            tr.weight += 1
+            act = tr.dest
+
+        for sym in rest:
+            dest = fresh()
+            self._states.add(dest)
+            self._trans[act][sym] = ffa.FFATrans(act, dest, 1, sym, 0)
+            act = dest
+        self._fin[act] += 1
+
+
+    @no_type_check
+    def rename_states(self) -> None:
+        """
+        Rename states to consecutive numbers (from 0) including the root
+        """
+        super(DFFA, self).rename_states()
+        self._root = self._states_dict[self._root]
+
+
     def _find_pred(self, state: ffa.StateType) -> Optional[Set[ffa.StateType]]:
         """!
         Get the predecessor of a given state
@@ -76,42 +132,79 @@ class DFFA(ffa.FFA):
 
 
     @no_type_check
-    def stochastic_merge(self, red: ffa.StateType, blue: ffa.StateType) -> None:
+    def stochastic_merge(self, red: ffa.StateType, blue: ffa.StateType, touched: Optional[Set[ffa.StateType]] = None, folded: Optional[Set[ffa.StateType]] = None, tr_pred: Optional[ffa.FFATrans] = None) -> None:
         """!
         Merging two states red and blue (followed by folding frequencies from the
         merged subtree).
 
         @param red: Red state
         @param blue: Blue state
+        @param touched: States whose frequencies or transitions were changed by
+            the folding (out parameter, optional)
+        @param folded: States of the blue subtree folded into the red part; they
+            are unreachable after the merge (out parameter, optional)
+        @param tr_pred: Transition leading to the blue state (if it is not
+            given, it is searched among all transitions)
         """
-        tr_pred = self._find_pred(blue)
+        if tr_pred is None:
+            tr_pred = self._find_pred(blue)
         if tr_pred is None:
             raise Exception("State {0} has no predecessors".format(blue))
 
         self._trans[tr_pred.src][tr_pred.symbol] = ffa.FFATrans(tr_pred.src, \
             red, tr_pred.weight, tr_pred.symbol, tr_pred.label)
-        self.stochastic_fold(red, blue)
+        self.stochastic_fold(red, blue, touched, folded)
 
 
 
-    def stochastic_fold(self, red: ffa.StateType, blue: ffa.StateType) -> None:
+    def stochastic_fold(self, red: ffa.StateType, blue: ffa.StateType, touched: Optional[Set[ffa.StateType]] = None, folded: Optional[Set[ffa.StateType]] = None) -> None:
         """!
         Fold frequencies from subtree given by blue root into the automaton
         rooted at the red state.
 
         @param red: Red state
         @param blue: Blue state
+        @param touched: States whose frequencies or transitions were changed by
+            the folding (out parameter, optional)
+        @param folded: States of the blue subtree folded into the red part
+            (out parameter, optional)
         """
-        self._fin[red] += self._fin[blue]
-        for sym, tr in self._trans[blue].items():
-            tr_dest = None
-            try:
-                tr_dest = self._trans[red][sym]
+        stack: List[Tuple[ffa.StateType, Iterator]] = list()
+        pair: Optional[Tuple[ffa.StateType, ffa.StateType]] = (red, blue)
+        while pair is not None or stack:
+            if pair is not None:
+                red, blue = pair
+                pair = None
+                if touched is not None:
+                    touched.add(red)
+                if folded is not None:
+                    folded.add(blue)
+                self._fin[red] += self._fin[blue]
+                stack.append((red, iter(self._trans[blue].items())))
+
+            red, items = stack[-1]
+            for sym, tr in items:
+                tr_dest = self._trans[red].get(sym)
+                if tr_dest is None:
+                    self._trans[red][sym] = ffa.FFATrans(red, tr.dest, tr.weight, tr.symbol, tr.label)
+                    continue
                 tr_dest.weight += tr.weight
-            except KeyError:
-                self._trans[red][sym] = ffa.FFATrans(red, tr.dest, tr.weight, tr.symbol, tr.label)
-                continue
-            self.stochastic_fold(tr_dest.dest, tr.dest)
+                pair = (tr_dest.dest, tr.dest)
+                break
+            else:
+                stack.pop()
+
+
+    @staticmethod
+    def hoeffding_factor(alpha: float) -> float:
+        """!
+        Factor of the Hoeffding bound used by the Alergia test
+
+        @param alpha: Merging parameter
+
+        @return Factor sqrt(0.5 * log10(2/alpha))
+        """
+        return math.sqrt(0.5 * math.log10(2.0/alpha))
 
 
     @staticmethod
@@ -128,7 +221,7 @@ class DFFA(ffa.FFA):
         @return Compatibility of two states/transitions (represented by freqencies)
         """
         gamma = abs(float(f1)/n1 - float(f2)/n2)
-        return gamma < (math.sqrt(1.0/n1) + math.sqrt(1.0/n2)) * math.sqrt(0.5 * math.log10(2.0/alpha))
+        return gamma < (math.sqrt(1.0/n1) + math.sqrt(1.0/n2)) * DFFA.hoeffding_factor(alpha)
 
 
     def state_freq(self, state: ffa.StateType) -> float:
@@ -183,20 +276,71 @@ class DFFA(ffa.FFA):
         """!
         Normalize frequency automaton to obtain a probabilistic automaton
         (probabilities are in the range [0,1] with the sum-consistency condition).
+        The automaton is returned together with its array-backed DPA (see
+        compile_dpa) used for scoring during the detection.
 
         @return Normalized automaton
         """
-        aut = self.to_wfa()
-        for tr in aut.get_transitions():
-            w = self.state_freq(tr.src)
-            tr.weight = float(tr.weight) / w
-        fin_new = defaultdict(lambda: 0)
-        for f in aut.get_finals().keys():
-            w = self.state_freq(f)
-            if aut.get_finals()[f] != 0:
-                fin_new[f] = aut.get_finals()[f] / float(w)
-
-        aut.set_finals(fin_new)
-        iniState = list(aut.get_starts())[0]
-        aut.get_starts()[iniState] = 1.0
+        totals = self.state_totals()
+        trs = [core_wfa.Transition(tr.src, tr.dest, tr.symbol, float(tr.weight) / totals[tr.src]) \
+            for tr in self.iter_transitions()]
+        fin_new: dict[ffa.StateType, float] = defaultdict(lambda: 0)
+        for f, w in self._fin.items():
+            if w != 0:
+                fin_new[f] = w / float(totals[f])
+
+        ini = dict(self._ini)
+        ini[next(iter(ini))] = 1.0
+        aut = core_wfa_export.CoreWFAExport(trs, fin_new, ini)
+        aut.set_compiled_dpa(self.compile_dpa(totals))
         return aut
+
+
+    def state_totals(self) -> dict[ffa.StateType, int]:
+        """!
+        Compute frequencies of all states at once (see state_freq)
+
+        @return State -> frequency of the state
+        """
+        totals: dict[ffa.StateType, int] = defaultdict(lambda: 0)
+        for st, w in self._fin.items():
+            totals[st] += w
+        for tr in self.iter_transitions():
+            totals[tr.src] += tr.weight
+        return totals
+
+
+    def compile_dpa(self, totals: Optional[dict[ffa.StateType, int]] = None) -> array_dpa.ArrayDPA:
+        """!
+        Compile the frequency automaton directly to an array-backed DPA (with
+        the same probabilities as the normalized automaton).
+
+        @param totals: Frequencies of states (see state_totals; computed if
+            None)
+
+        @return Array-backed DPA
+        """
+        if totals is None:
+            totals = self.state_totals()
+        root = next(iter(self._ini))
+        index: dict[ffa.StateType, int] = {root: 0}
+        for st in self._states:
+            if st not in index:
+                index[st] = len(index)
+        symbols: dict = dict()
+        for tr in self.iter_transitions():
+            if tr.symbol not in symbols:
+                symbols[tr.symbol] = len(symbols)
+
+        trans = [[-1]*len(symbols) for _ in range(len(index))]
+        logw = [[array_dpa.NO_WEIGHT]*len(symbols) for _ in range(len(index))]
+        finals = [array_dpa.NO_WEIGHT]*len(index)
+        for tr in self.iter_transitions():
+            src, col = index[tr.src], symbols[tr.symbol]
+            trans[src][col] = index[tr.dest]
+            if tr.weight > 0:
+                logw[src][col] = math.log(float(tr.weight) / totals[tr.src])
+        for st, w in self._fin.items():
+            if w != 0:
+                finals[index[st]] = math.log(w / float(totals[st]))
+        return array_dpa.ArrayDPA(symbols, trans, logw, finals, 0.0)
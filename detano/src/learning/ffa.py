@@ -24,7 +24,7 @@
 import copy
 from dataclasses import dataclass
 from collections import defaultdict
-from typing import List, Set, Union, Optional, Tuple, no_type_check, TypeVar, Generic
+from typing import Any, List, Set, Union, Optional, Tuple, Iterable, Iterator, no_type_check, TypeVar, Generic
 
 import wfa.core_wfa as core_wfa
 import wfa.core_wfa_export as core_wfa_export
@@ -74,80 +74,86 @@ class FFA:
         self._states_dict: Optional[dict[StateType, StateType]] = None
 
 
-    def _find_eq_trans(self, val: FFATrans, trans: Set[FFATrans]) -> Optional[FFATrans]:
+    def _create_tr_func(self, tr_list: Iterable[FFATrans]) -> TransFuncType:
         """!
-        Find transition with equal structure (except weight and label)
-
-        @param val: Given transition
-        @param trans: Collection of all transitions
-
-        @return Transition corresponding to val
-        """
-        for tr in trans:
-            if tr.src == val.src and tr.dest == val.dest and tr.symbol == val.symbol:
-                return tr
-        return None
-
-
-    def _create_tr_func(self, tr_list: List[FFATrans]) -> TransFuncType:
-        """!
-        Create transition function from a list of transitions
+        Create transition function from a list of transitions (transitions with
+        equal structure except weight and label are aggregated)
 
         @param tr_list: List of transitions
 
         @return Transitions represented by a dictionary (transition function)
         """
-        tr_func: TransFuncType = defaultdict(lambda: dict())
+        agg: dict[Tuple[StateType, Any, StateType], FFATrans] = dict()
         for tr in tr_list:
+            key = (tr.src, tr.symbol, tr.dest)
+            tr_m = agg.get(key)
+            if tr_m is None:
+                agg[key] = tr
+                continue
+            tr_m.weight += tr.weight
+            tr_m.label = min(tr_m.label, tr.label)
+
+        # transitions are inserted into the sets after the aggregation (weights
+        # are part of the hash)
+        tr_func: TransFuncType = defaultdict(lambda: dict())
+        for tr in agg.values():
             try:
-                tmp = tr_func[tr.src][tr.symbol]
-                tr_m = self._find_eq_trans(tr, tmp)
-                if tr_m is None:
-                    tr_func[tr.src][tr.symbol].add(tr)
-                    continue
-                tr_m.weight += tr.weight
-                tr_m.label = min(tr_m.label, tr.label)
+                tr_func[tr.src][tr.symbol].add(tr)
             except KeyError:
                 tr_func[tr.src][tr.symbol] = set([tr])
         return tr_func
 
 
 
-    def _merge_in_dict(self, states: Set[StateType], id: StateType, dct: StateWeightType):
+    def _merge_in_dict(self, rep: dict[StateType, StateType], dct: StateWeightType):
         """!
         Merge states in initial/final state vector
 
-        @param states: Collection of states
-        @param id: Identifier
+        @param rep: Representatives of merged states (state -> representative)
         @param dct: Dictionary
 
         @return Dictionary with merged values
         """
         new_dict: StateWeightType = defaultdict(lambda: 0)
-        tw = 0
+        merged: StateWeightType = defaultdict(lambda: 0)
         for st, weight in dct.items():
-            if st in states:
-                tw += weight
+            if st in rep:
+                merged[rep[st]] += weight
             else:
                 new_dict[st] = weight
-        if tw > 0:
-            new_dict[id] = tw
+        for st, weight in merged.items():
+            if weight > 0:
+                new_dict[st] = weight
         return new_dict
 
 
-    def get_transition_list(self) -> List[FFATrans]:
+    def iter_transitions(self) -> Iterator[FFATrans]:
         """!
-        Get list of transitions from the transition function
+        Iterate over all transitions of the transition function (a view, the
+        transitions are not copied)
 
-        @return List of transitions
+        @return Iterator over transitions
         """
-        lst: List[FFATrans] = []
-        for src, tr_dest in self._trans.items():
-            for sym, dst in tr_dest.items():
+        for tr_dest in self._trans.values():
+            for dst in tr_dest.values():
                 if isinstance(dst, set):
-                    lst = lst + list(copy.deepcopy(dst))
+                    yield from dst
                 else:
-                    lst.append(dst)
+                    yield dst
+
+
+    def get_transition_list(self, deep: bool=False) -> List[FFATrans]:
+        """!
+        Get list of transitions from the transition function
+
+        @param deep: Return copies of the transitions (otherwise the list
+            contains the transitions of the automaton)
+
+        @return List of transitions
+        """
+        lst = list(self.iter_transitions())
+        if deep:
+            return copy.deepcopy(lst)
         return lst
 
 
@@ -157,10 +163,8 @@ class FFA:
 
         @return FFA with the inverse transition function
         """
-        lst = copy.deepcopy(self.get_transition_list())
-        for tr in lst:
-            tr.src, tr.dest = tr.dest, tr.src
-
+        lst = [FFATrans(tr.dest, tr.src, tr.weight, tr.symbol, tr.label) \
+            for tr in self.iter_transitions()]
         trs = self._create_tr_func(lst)
         return FFA(self.get_states(), trs, self._fin, self._ini)
 
@@ -192,6 +196,16 @@ class FFA:
         return self._fin
 
 
+    def get_rename_dict(self) -> Optional[dict[StateType, StateType]]:
+        """!
+        Get the dictionary containing original state labels and renamed state
+        labels. The dictionary is created after method rename_states is invoked.
+
+        @return Dictionary: State (original) -> State (renamed).
+        """
+        return self._states_dict
+
+
     def get_transitions(self) -> TransFuncMixType:
         """!
         Get transitions
@@ -244,10 +258,20 @@ class FFA:
 
         @return Set of reachable states
         """
-        new_set = self.successors_set(st_set)
-        if new_set <= st_set:
-            return st_set
-        return self.reachable_states(new_set | st_set)
+        reach = set(st_set)
+        stack = list(reach)
+        while stack:
+            st = stack.pop()
+            for tr_dest in self._trans.get(st, dict()).values():
+                if isinstance(tr_dest, set):
+                    dests = [tr.dest for tr in tr_dest]
+                else:
+                    dests = [tr_dest.dest]
+                for dest in dests:
+                    if dest not in reach:
+                        reach.add(dest)
+                        stack.append(dest)
+        return reach
 
 
     def merge_states(self, states: Set[StateType]) -> None:
@@ -256,25 +280,7 @@ class FFA:
 
         @param states: States to be merged
         """
-        id = next(iter(states))
-        self._states = self._states - states
-        deterministic = False
-        tr_lst = self.get_transition_list()
-
-        if len(tr_lst) == 0:
-            return
-        deterministic = isinstance(self._trans[tr_lst[0].src][tr_lst[0].symbol], set)
-        for tr in tr_lst:
-            if tr.src in states:
-                tr.src = id
-            if tr.dest in states:
-                tr.dest = id
-
-        self._trans = self._create_tr_func(tr_lst)
-        self._states.add(id)
-        self._ini = self._merge_in_dict(states, id, self._ini)
-        self._fin = self._merge_in_dict(states, id, self._fin)
-        self._states_dict = None
+        self.quotient([states])
 
 
     def merge_equivalent(self, classes: Set[Set[StateType]]) -> None:
@@ -283,8 +289,35 @@ class FFA:
 
         @param classes: Partitioning of the states
         """
+        self.quotient(classes)
+
+
+    def quotient(self, classes: Iterable[Set[StateType]]) -> None:
+        """!
+        Merge all classes of states at once (each class is replaced with one
+        of its states). The transition function is rebuilt in a single pass.
+
+        @param classes: Disjoint sets of states (states not contained in any
+            class are kept)
+        """
+        rep: dict[StateType, StateType] = dict()
         for item in classes:
-            self.merge_states(item)
+            if len(item) == 0:
+                continue
+            id = next(iter(item))
+            for st in item:
+                rep[st] = id
+        if len(rep) == 0:
+            return
+
+        tr_lst = [FFATrans(rep.get(tr.src, tr.src), rep.get(tr.dest, tr.dest), \
+            tr.weight, tr.symbol, tr.label) for tr in self.iter_transitions()]
+        if len(tr_lst) > 0:
+            self._trans = self._create_tr_func(tr_lst)
+        self._states = set([rep.get(st, st) for st in self._states])
+        self._ini = self._merge_in_dict(rep, self._ini)
+        self._fin = self._merge_in_dict(rep, self._fin)
+        self._states_dict = None
 
 
     def path_length(self, st1: StateType, st2: StateType) -> Optional[int]:
@@ -329,6 +362,20 @@ class FFA:
         self._trans = new_tran
 
 
+    def remove_states(self, states: Set[StateType]) -> None:
+        """!
+        Remove given states together with their outgoing transitions. The
+        removed states are assumed to be unreachable (e.g., the states folded
+        during a merge), so no transition leads to them from the remaining part.
+
+        @param states: States to be removed
+        """
+        for st in states:
+            self._trans.pop(st, None)
+            self._fin.pop(st, None)
+        self._states -= states
+
+
     @no_type_check
     def rename_states(self) -> None:
         """
@@ -403,13 +450,8 @@ class FFA:
             dot += "\"init{0}\" [label=\"{1}\",shape=plaintext];".format(state, weight)
             dot += "\"init{0}\" -> \"{1}\";\n".format(state, state)
 
-        for _, tr_dest in self._trans.items():
-            for sym, dst in tr_dest.items():
-                if isinstance(dst, set):
-                    for tr in dst:
-                        dot += self._print_transition(tr.src, tr.dest, tr.symbol, tr.weight)
-                else:
-                    dot += self._print_transition(dst.src, dst.dest, dst.symbol, dst.weight)
+        for tr in self.iter_transitions():
+            dot += self._print_transition(tr.src, tr.dest, tr.symbol, tr.weight)
 
         dot += "}"
         return dot
@@ -441,14 +483,6 @@ class FFA:
 
         @return FFA represented as WFA
         """
-        trs = []
-        for _, tr_dest in self._trans.items():
-            for sym, dst in tr_dest.items():
-                if isinstance(dst, set):
-                    for tr in dst:
-                        trs.append(core_wfa.Transition(tr.src, tr.dest, \
-                            tr.symbol, tr.weight))
-                else:
-                    trs.append(core_wfa.Transition(dst.src, dst.dest, \
-                        dst.symbol, dst.weight))
+        trs = [core_wfa.Transition(tr.src, tr.dest, tr.symbol, tr.weight) \
+            for tr in self.iter_transitions()]
         return core_wfa_export.CoreWFAExport(trs, self._fin, self._ini)
@@ -171,7 +171,7 @@ class FPT(dffa.DFFA):
         @return Number of edge labelled by label
         """
         cnt = 0
-        for tr in self.get_transition_list():
+        for tr in self.iter_transitions():
             if tr.label == label:
                 cnt += 1
         return cnt
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+
+"""!
+\brief Incremental Alergia
+
+\details
+    Incremental learning of deterministic probabilistic automata. The learner
+    keeps the frequency automaton obtained by Alergia together with its red
+    states. New conversations are added to the frequencies of the automaton
+    (conversations leaving the automaton create new prefix-tree branches) and
+    the Alergia merging is resumed from the previous red states, so only the
+    new branches and the remaining blue states are decided again. Previous
+    merges are never revisited (the learned automaton can therefore differ
+    from the automaton learned from all conversations at once). The state of
+    the learner can be saved to a NumPy .npz file and loaded later to add new
+    traffic.
+
+\author Vojtěch Havlena
+
+\copyright
+    Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>\n
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.\n
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.\n
+    You should have received a copy of the GNU General Public License.
+    If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import ast
+import json
+import math
+import numpy
+import learning.fpt as fpt
+import learning.dffa as dffa
+import learning.ffa as ffa
+import learning.alergia as alergia
+import wfa.core_wfa_export as core_wfa_export
+
+from collections import defaultdict
+from typing import List, Set, Optional
+
+## Version of the format of saved learners
+VERSION = 1
+
+class IncrementalAlergia:
+    """!
+    Incremental PA learning using Alergia
+    """
+
+    def __init__(self, alpha: float, t0: Optional[int] = None):
+        """!
+        Constructor
+
+        @param alpha: Merging parameter
+        @param t0: The minimum number of strings for merging a state (if not
+            given, log2 of the number of all added conversations is used)
+        """
+        ## Merging parameter
+        self.alpha = alpha
+        ## The minimum number of strings for merging a state
+        self.t0 = t0
+        ## Learned frequency automaton
+        self.freq_aut: Optional[dffa.DFFA] = None
+        ## Red states of the last run of Alergia
+        self.reds: Set[ffa.StateType] = set()
+        ## Number of all added conversations
+        self.count = 0
+        self._next_state = 0
+
+
+    def get_t0(self) -> int:
+        """!
+        Get the value of t0 for the current number of conversations
+
+        @return t0
+        """
+        if self.t0 is not None:
+            return self.t0
+        return int(math.log(self.count, 2))
+
+
+    def _fresh_state(self) -> ffa.StateType:
+        """!
+        Get a new state (states are renamed to consecutive numbers)
+
+        @return New state
+        """
+        self._next_state += 1
+        return str(self._next_state - 1)
+
+
+    def add_conversations(self, lst: List) -> None:
+        """!
+        Add conversations and update the learned automaton.
+
+        @param lst: List of conversations
+        """
+        if len(lst) == 0:
+            return
+        self.count += len(lst)
+
+        if self.freq_aut is None:
+            tree = fpt.FPT()
+            tree.add_string_list(lst)
+            frontier = alergia.AlergiaFrontier(tree, self.get_t0())
+            alergia.alergia_frontier(frontier, self.alpha)
+            tree.rename_states()
+            ren = tree.get_rename_dict()
+            self.reds = set([ren[st] for st in frontier.red_list])
+            self._next_state = len(tree.get_states())
+            self.freq_aut = tree.copy()
+            return
+
+        for conv in lst:
+            self.freq_aut.add_frequencies(conv, self._fresh_state)
+        frontier = alergia.AlergiaFrontier(self.freq_aut, self.get_t0(), self.reds)
+        alergia.alergia_frontier(frontier, self.alpha)
+        self.reds = frontier.red_set
+
+
+    def get_automaton(self) -> core_wfa_export.CoreWFAExport:
+        """!
+        Get the learned PA
+
+        @return Normalized automaton
+        """
+        if self.freq_aut is None:
+            raise Exception("no conversations were added")
+        return self.freq_aut.copy().normalize()
+
+
+    def save(self, path: str) -> None:
+        """!
+        Save the state of the learner (parameters, the frequency automaton and
+        red states) to a binary file (.npz, without pickled objects).
+
+        @param path: Output file
+        """
+        if self.freq_aut is None:
+            raise Exception("no conversations were added")
+        trs = list(self.freq_aut.iter_transitions())
+        meta = {"version": VERSION, "alpha": self.alpha, "t0": self.t0, "count": self.count, \
+            "next_state": self._next_state, "root": self.freq_aut.get_root(), \
+            "states": sorted(self.freq_aut.get_states()), "reds": sorted(self.reds), \
+            "ini": dict(self.freq_aut._get_inits()), "fin": dict(self.freq_aut.get_finals())}
+        with open(path, "wb") as fd:
+            numpy.savez_compressed(fd, meta=numpy.array(json.dumps(meta)), \
+                src=numpy.array([tr.src for tr in trs], dtype=str), \
+                dest=numpy.array([tr.dest for tr in trs], dtype=str), \
+                symbol=numpy.array([repr(tr.symbol) for tr in trs], dtype=str), \
+                weight=numpy.array([tr.weight for tr in trs], dtype=numpy.int64), \
+                label=numpy.array([tr.label for tr in trs], dtype=numpy.int64))
+
+
+    @staticmethod
+    def load(path: str) -> "IncrementalAlergia":
+        """!
+        Load a learner saved by IncrementalAlergia.save.
+
+        @param path: Input file
+
+        @return Learner
+        """
+        with numpy.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != VERSION:
+                raise ValueError("Unsupported version of the learner file: {0}".format(meta.get("version")))
+            trans: ffa.TransFuncDetType = defaultdict(lambda: dict())
+            for src, dest, sym, weight, label in zip(data["src"].tolist(), data["dest"].tolist(), \
+                    data["symbol"].tolist(), data["weight"].tolist(), data["label"].tolist()):
+                sym = ast.literal_eval(sym)
+                trans[src][sym] = ffa.FFATrans(src, dest, weight, sym, label)
+
+        learner = IncrementalAlergia(meta["alpha"], meta["t0"])
+        learner.freq_aut = dffa.DFFA(set(meta["states"]), trans, defaultdict(lambda: 0, meta["ini"]), \
+            defaultdict(lambda: 0, meta["fin"]), meta["root"])
+        learner.reds = set(meta["reds"])
+        learner.count = meta["count"]
+        learner._next_state = meta["next_state"]
+        return learner
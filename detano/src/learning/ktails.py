@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""!
+\brief k-tails algorithm
+
+\details
+    Learning of deterministic probabilistic automata by merging states of a
+    frequency prefix tree having the same k-tails (future languages restricted
+    to strings of the length at most k). The k-tails are computed on the prefix
+    tree only once (bottom-up, each k-tail is represented by an interned
+    number), so the learning runs in time linear in the size of the tree. The
+    merging itself uses the same folding as Alergia, hence the result is a
+    deterministic frequency automaton that can be normalized to a PA.
+
+\author Vojtěch Havlena
+
+\copyright
+    Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>\n
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.\n
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.\n
+    You should have received a copy of the GNU General Public License.
+    If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import learning.dffa as dffa
+import learning.ffa as ffa
+import learning.alergia as alergia
+
+from typing import Any, Optional
+
+## Default length of k-tails
+K = 2
+
+
+def ktails_signatures(freq_aut: dffa.DFFA, k: int) -> dict[ffa.StateType, int]:
+    """!
+    Compute k-tails of all states. The k-tail of a state is given by the
+    acceptance of the state and by the k-1-tails of its successors. Each
+    k-tail is interned to a number (equal numbers mean equal k-tails).
+
+    @param freq_aut: Frequency automaton
+    @param k: Length of k-tails
+
+    @return Dictionary assigning State -> k-tail (number)
+    """
+    table: dict[Any, int] = dict()
+    states = freq_aut.get_states()
+    finals = freq_aut.get_finals()
+    trans = freq_aut.get_transitions()
+
+    sig: dict[ffa.StateType, int] = dict()
+    for st in states:
+        sig[st] = table.setdefault((finals.get(st, 0) > 0, ()), len(table))
+
+    for _ in range(k):
+        new_sig: dict[ffa.StateType, int] = dict()
+        for st in states:
+            succ = tuple(sorted((sym, sig[tr.dest]) for sym, tr in trans[st].items()))
+            new_sig[st] = table.setdefault((finals.get(st, 0) > 0, succ), len(table))
+        sig = new_sig
+    return sig
+
+
+def ktails(freq_aut: dffa.DFFA, k: int = K) -> dffa.DFFA:
+    """!
+    PA learning using the k-tails algorithm. States are processed in the same
+    red-blue order as in Alergia; a blue state is merged to the red state having
+    the same k-tail, otherwise it becomes red.
+
+    @param freq_aut: A frequency automaton constructed from the input sample
+    @param k: Length of k-tails
+
+    @return Compact frequency automaton (no normalization applied)
+    """
+    sig = ktails_signatures(freq_aut, k)
+    frontier = alergia.RedBlueFrontier(freq_aut, 0)
+    root = freq_aut.get_root()
+    reds: dict[int, ffa.StateType] = { sig[root]: root }
+
+    blue = frontier.choose_blue()
+    while blue is not None:
+        red: Optional[ffa.StateType] = reds.get(sig[blue], None)
+
+        if red is not None:
+            frontier.merge(red, blue)
+        else:
+            reds[sig[blue]] = blue
+            frontier.promote(blue)
+
+        blue = frontier.choose_blue()
+
+    return freq_aut
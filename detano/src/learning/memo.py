@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""!
+\brief Memoization of learned automata
+
+\details
+    LRU cache of automata learned from lists of conversations. The cache is
+    keyed by a canonical hash of the multiset of conversations (the learning
+    does not depend on the order of conversations) together with the learning
+    procedure and its parameters, so windows containing the same conversations
+    share a single learned automaton. Stored automata are frozen, since they
+    are shared by all callers.
+
+\author Vojtěch Havlena
+
+\copyright
+    Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>\n
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.\n
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.\n
+    You should have received a copy of the GNU General Public License.
+    If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+from collections import Counter, OrderedDict
+from typing import Any, Callable, List, Tuple
+
+
+class LearningCache:
+    """!
+    LRU cache of a learning procedure (conversations -> automaton)
+    """
+
+    def __init__(self, learn_proc: Callable, maxsize: int = 256, params: Tuple = ()):
+        """!
+        Constructor
+
+        @param learn_proc: Learning procedure taking a list of conversations
+        @param maxsize: Maximum number of stored automata
+        @param params: Parameters of the learning procedure (part of the key)
+        """
+        ## Learning procedure
+        self.learn_proc = learn_proc
+        ## Maximum number of stored automata
+        self.maxsize = maxsize
+        self.params = params
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[str, Any] = OrderedDict()
+
+
+    def key(self, training: List) -> str:
+        """!
+        Canonical key of a list of conversations (invariant to the order of
+        conversations).
+
+        @param training: List of conversations
+
+        @return Key (hexadecimal digest)
+        """
+        multiset = sorted(Counter(tuple(conv) for conv in training).items())
+        content = repr((self.learn_proc.__module__, self.learn_proc.__qualname__, self.params, multiset))
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+    def __call__(self, training: List) -> Any:
+        """!
+        Get an automaton learned from the conversations (learn a new one if it
+        is not stored). The returned automaton is frozen.
+
+        @param training: List of conversations
+
+        @return Learned automaton
+        """
+        key = self.key(training)
+        try:
+            aut = self._cache[key]
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return aut
+        except KeyError:
+            pass
+
+        self.misses += 1
+        aut = self.learn_proc(training)
+        if aut is not None:
+            aut.freeze()
+        self._cache[key] = aut
+        if len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return aut
+
+
+    def summary(self) -> str:
+        """!
+        Get a summary of the cache usage
+
+        @return Hits, misses and the hit rate
+        """
+        total = self.hits + self.misses
+        rate = self.hits / float(total) if total > 0 else 0.0
+        return "hits: {0}, misses: {1}, hit rate: {2:.3f}".format(self.hits, self.misses, rate)
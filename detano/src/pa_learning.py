@@ -24,16 +24,21 @@ import getopt
 import os
 import csv
 import math
+import multiprocessing
 from enum import Enum
 from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
 import learning.fpt as fpt
 import learning.alergia as alergia
+import learning.ktails as ktails
+import learning.incremental as incremental
 import parser.IEC104_parser as con_par
 import parser.IEC104_conv_parser as iec_prep_par
 
 rows_filter = ["asduType", "cot"]
 TRAINING = 0.33
+ALPHA = 0.05
 
 """
 Program parameters
@@ -41,6 +46,7 @@ Program parameters
 class Algorithms(Enum):
     PA = 0
     PTA = 1
+    KTAILS = 2
 
 
 """
@@ -59,6 +65,10 @@ class Params:
     alg : Algorithms
     file : str
     file_format : InputFormat
+    alphas : List[float]
+    t0s : List[Optional[int]]
+    jobs : int
+    learner : Optional[str]
 
 
 """
@@ -75,15 +85,26 @@ Print help message
 def print_help():
     print("./pa_learning <csv file> [OPT]")
     print("OPT are from the following: ")
-    print("\t--atype=pa/pta\t\tlearning based on PAs/PTAs (default PA)")
+    print("\t--atype=pa/pta/ktails\tlearning based on PAs (Alergia)/PTAs/PAs (k-tails) (default PA)")
     print("\t--format=conv/ipfix\tformat of input file: conversations/IPFIX (default IPFIX)")
+    print("\t--alpha=val[,val...]\tmerging parameter(s) of Alergia (default 0.05)")
+    print("\t--t0=val[,val...]\tminimum frequency(ies) of merged states (default log2 of the training size)")
+    print("\t--jobs=num\t\tnumber of parallel processes for a parameter sweep (default 1)")
+    print("\t--learner=file\t\tincremental learning: add the training data to the learner stored in file (for pa only)")
     print("\t--help\t\t\tprint this message")
 
 
+"""
+Default value of t0 for a given training set
+"""
+def default_t0(training):
+    return int(math.log(len(training), 2))
+
+
 """
 Function for learning based on Alergia (PA)
 """
-def learn_pa(training):
+def learn_pa(training, alpha=ALPHA, t0=None):
     if len(training) == 0:
         raise Exception("training set is empty")
 
@@ -91,8 +112,8 @@ def learn_pa(training):
     for line in training:
         tree.add_string(line)
 
-    alpha = 0.05
-    t0 = int(math.log(len(training), 2))
+    if t0 is None:
+        t0 = default_t0(training)
 
     aut = alergia.alergia(tree, alpha, t0)
     aut.rename_states()
@@ -100,9 +121,31 @@ def learn_pa(training):
 
 
 """
-Function for learning based on prefix trees (PTA)
+Incremental learning based on Alergia (PA): the training conversations are
+added to the learner stored in learner_file (a new learner is created if the
+file does not exist) and the updated learner is stored back. Merges of the
+previous runs are kept (they are never revisited). alpha and t0 are taken
+from the stored learner (given values must not conflict with them).
 """
-def learn_pta(training):
+def learn_pa_incremental(training, learner_file, alpha=None, t0=None):
+    if len(training) == 0:
+        raise Exception("training set is empty")
+
+    if os.path.exists(learner_file):
+        learner = incremental.IncrementalAlergia.load(learner_file)
+        if (alpha is not None and alpha != learner.alpha) or (t0 is not None and t0 != learner.t0):
+            raise Exception("alpha/t0 conflict with the stored learner (alpha: {0}, t0: {1})".format(learner.alpha, learner.t0))
+    else:
+        learner = incremental.IncrementalAlergia(ALPHA if alpha is None else alpha, t0)
+    learner.add_conversations(training)
+    learner.save(learner_file)
+    return learner.get_automaton(), learner.alpha, learner.get_t0()
+
+
+"""
+Function for learning based on prefix trees (PTA) (alpha and t0 are not used)
+"""
+def learn_pta(training, alpha=None, t0=None):
     if len(training) == 0:
         raise Exception("training set is empty")
 
@@ -112,15 +155,29 @@ def learn_pta(training):
     return tree.normalize(), None, None
 
 
+"""
+Function for learning based on k-tails (alpha and t0 are not used)
+"""
+def learn_ktails(training, alpha=None, t0=None):
+    if len(training) == 0:
+        raise Exception("training set is empty")
+
+    tree = fpt.FPT()
+    tree.add_string_list(training)
+    aut = ktails.ktails(tree, ktails.K)
+    aut.rename_states()
+    return aut.normalize(), None, None
+
+
 """
 Store automaton into file
 """
-def store_automata(csv_file, fa, alpha, t0):
+def store_automata(csv_file, fa, alpha, t0, atype="pta"):
     store_filename = os.path.splitext(os.path.basename(csv_file))[0]
     if (alpha is not None) and (t0 is not None):
         store_filename = "{0}a{1}t{2}".format(store_filename, alpha, t0)
     else:
-        store_filename = "{0}-pta".format(store_filename)
+        store_filename = "{0}-{1}".format(store_filename, atype)
 
     fa_fd = open("{0}.fa".format(store_filename), "w")
     fa_fd.write(fa.to_fa_format(True))
@@ -135,20 +192,82 @@ def store_automata(csv_file, fa, alpha, t0):
     dot_fd.close()
 
 
+"""
+Count conversations from testing that are not accepted by the automaton
+"""
+def count_miss(fa, testing):
+    return fa.score_batch(testing).count(None)
+
+
+"""
+Prefix tree and testing data shared by processes of the parameter sweep
+(inherited by forked processes, not pickled)
+"""
+sweep_data = None
+
+
+def _sweep_init(tree, testing):
+    global sweep_data
+    sweep_data = (tree, testing)
+
+
+"""
+Learn and evaluate a PA for a single point of the parameter sweep. The shared
+prefix tree is not modified; the merging runs on its snapshot.
+"""
+def _sweep_point(point: Tuple[float, int]) -> Tuple[float, int, int, int]:
+    tree, testing = sweep_data
+    alpha, t0 = point
+    aut = alergia.alergia(tree.copy(), alpha, t0)
+    aut.rename_states()
+    fa = aut.normalize()
+    return alpha, t0, len(fa.get_states()), count_miss(fa, testing)
+
+
+"""
+Learning of PAs for all combinations of alpha and t0 values sharing a
+single prefix tree built from the training data
+"""
+def learn_pa_sweep(training, testing, alphas, t0s, jobs=1):
+    if len(training) == 0:
+        raise Exception("training set is empty")
+
+    tree = fpt.FPT()
+    tree.add_string_list(training)
+    t0s = [default_t0(training) if t0 is None else t0 for t0 in t0s]
+    points = [(alpha, t0) for alpha in alphas for t0 in t0s]
+
+    if jobs <= 1:
+        _sweep_init(tree, testing)
+        return list(map(_sweep_point, points))
+
+    with multiprocessing.get_context("fork").Pool(jobs, _sweep_init, (tree, testing)) as pool:
+        return pool.map(_sweep_point, points)
+
+
+"""
+Parse a comma separated list of values
+"""
+def parse_list(val, conv):
+    return [conv(v) for v in val.split(",")]
+
+
 """
 Main
 """
 def main():
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "ha:f:", ["help", "atype=", "format="])
+        opts, args = getopt.getopt(sys.argv[1:], "ha:f:", ["help", "atype=", "format=", "alpha=", "t0=", "jobs=", "learner="])
         if len(args) > 0:
-            opts, _ = getopt.getopt(args[1:], "ha:f:", ["help", "atype=", "format="])
+            opts, _ = getopt.getopt(args[1:], "ha:f:", ["help", "atype=", "format=", "alpha=", "t0=", "jobs=", "learner="])
     except getopt.GetoptError as err:
         sys.stderr.write("Error: bad parameters (try --help)\n")
         sys.exit(1)
 
-    params = Params(Algorithms.PA, None, InputFormat.IPFIX)
+    params = Params(Algorithms.PA, None, InputFormat.IPFIX, [ALPHA], [None], 1, None)
     learn_fnc = learn_pa
+    # options given explicitly (checked against a stored learner)
+    explicit = set()
 
     for o, a in opts:
         if o in ("-a", "--atype"):
@@ -158,6 +277,11 @@ def main():
             elif a == "pta":
                 params.alg = Algorithms.PTA
                 learn_fnc = learn_pta
+            elif a == "ktails":
+                params.alg = Algorithms.KTAILS
+                learn_fnc = learn_ktails
+        elif o == "--learner":
+            params.learner = a
         elif o in ("-h", "--help"):
             print_help()
             sys.exit()
@@ -166,10 +290,29 @@ def main():
                 params.file_format = InputFormat.CONV
             elif a == "ipfix":
                 params.file_format = InputFormat.IPFIX
+        elif o in ("--alpha", "--t0", "--jobs"):
+            try:
+                if o == "--alpha":
+                    params.alphas = parse_list(a, float)
+                elif o == "--t0":
+                    params.t0s = parse_list(a, int)
+                else:
+                    params.jobs = int(a)
+                explicit.add(o)
+            except ValueError:
+                sys.stderr.write("Error: bad value of {0} (try --help)\n".format(o))
+                sys.exit(1)
         else:
             sys.stderr.write("Error: unrecognized parameters (try --help)\n")
             sys.exit(1)
 
+    if params.alg != Algorithms.PA and len(params.alphas) * len(params.t0s) > 1:
+        sys.stderr.write("Error: lists of --alpha/--t0 values are supported for --atype=pa only (try --help)\n")
+        sys.exit(1)
+    if params.learner is not None and (params.alg != Algorithms.PA or len(params.alphas) * len(params.t0s) > 1):
+        sys.stderr.write("Error: --learner supports --atype=pa with single --alpha/--t0 values only (try --help)\n")
+        sys.exit(1)
+
     if len(args) == 0:
         sys.stderr.write("Missing input file (try --help)\n")
         sys.exit(1)
@@ -203,23 +346,39 @@ def main():
     index = int(len(lines)*TRAINING)
     training, testing = lines[:index], lines[index:]
 
+    if params.alg == Algorithms.PA and len(params.alphas) * len(params.t0s) > 1:
+        try:
+            res = learn_pa_sweep(training, testing, params.alphas, params.t0s, params.jobs)
+        except Exception as e:
+            sys.stderr.write("Learning error: {0}\n".format(e))
+            sys.exit(1)
+
+        print("File: {0}".format(csv_file))
+        print("alpha;t0;states;missclassified/all;accuracy")
+        for alpha, t0, states, miss in res:
+            acc = (len(testing)-miss)/float(len(testing)) if len(testing) > 0 else None
+            print("{0};{1};{2};{3}/{4};{5}".format(alpha, t0, states, miss, len(testing), acc))
+        return
+
     try:
-        fa, alpha, t0 = learn_fnc(training)
+        if params.learner is not None:
+            fa, alpha, t0 = learn_pa_incremental(training, params.learner, \
+                params.alphas[0] if "--alpha" in explicit else None, params.t0s[0])
+        else:
+            fa, alpha, t0 = learn_fnc(training, params.alphas[0], params.t0s[0])
     except Exception as e:
         sys.stderr.write("Learning error: {0}\n".format(e))
         sys.exit(1)
 
-    store_automata(csv_file, fa, alpha, t0)
+    store_automata(csv_file, fa, alpha, t0, params.alg.name.lower())
 
-    miss = 0
-    for line in testing:
-        prob = fa.string_prob_deterministic(line)
-        if prob is None:
-            miss += 1
+    miss = count_miss(fa, testing)
 
     print("File: {0}".format(csv_file))
     if (alpha is not None) and (t0 is not None):
         print("alpha: {0}, t0: {1}".format(alpha, t0))
+    if params.alg == Algorithms.KTAILS:
+        print("k: {0}".format(ktails.K))
     print("States {0}".format(len(fa.get_states())))
     print("Testing: {0}/{1} (missclassified/all)".format(miss, len(testing)))
     if len(testing) > 0:
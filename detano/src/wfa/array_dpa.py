@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+
+"""!
+\brief Array-backed deterministic probabilistic automata
+
+\details
+    Compact representation of deterministic probabilistic automata (DPAs)
+    used for scoring strings during the detection. States are numbered from 0
+    (the initial state) to n-1, symbols are interned to column indices, and
+    the transition function is stored as an n x m array of destination states
+    (-1 for a missing transition) together with an array of log-weights.
+
+\author Vojtěch Havlena
+
+\copyright
+    Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>\n
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.\n
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.\n
+    You should have received a copy of the GNU General Public License.
+    If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import math
+import numpy
+
+from typing import List, Optional, Any, Tuple, Callable
+
+## Log-weight of missing transitions and non-final states
+NO_WEIGHT = -math.inf
+
+
+class ArrayDPA:
+    """!
+    Deterministic probabilistic automaton stored in arrays
+    """
+
+    def __init__(self, symbols: dict[Any, int], trans: List[List[int]], logw: List[List[float]], finals: List[float], start: float):
+        """!
+        Constructor
+
+        @param symbols: Symbol -> column index
+        @param trans: Destination state for each state and symbol (-1 if there
+            is no transition)
+        @param logw: Log-weight of the transition for each state and symbol
+        @param finals: Log of the final weight of each state (NO_WEIGHT for
+            non-final states)
+        @param start: Log of the weight of the initial state 0
+        """
+        ## Symbol -> column index
+        self.symbols = symbols
+        ## Transition function (states x symbols)
+        self.trans = numpy.array(trans, dtype=numpy.int64).reshape(len(finals), len(symbols))
+        ## Log-weights of transitions (states x symbols)
+        self.logw = numpy.array(logw, dtype=numpy.float64).reshape(len(finals), len(symbols))
+        ## Log-weights of final states
+        self.finals = numpy.array(finals, dtype=numpy.float64)
+        ## Log-weight of the initial state
+        self.start = start
+        self._trans_rows = trans
+        self._logw_rows = logw
+        self._finals_lst = finals
+
+
+    @staticmethod
+    def from_wfa(aut: Any) -> "ArrayDPA":
+        """!
+        Compile a deterministic WFA (CoreWFA) to the array form. The first start
+        state becomes the state 0. In the case of nondeterminism, the first
+        transition over a symbol is used.
+
+        @param aut: Deterministic WFA
+
+        @return Array-backed DPA
+        """
+        index: dict[Any, int] = dict()
+        for st in list(aut.get_starts().keys())[:1]:
+            index[st] = 0
+        symbols: dict[Any, int] = dict()
+        for tr in aut.get_transitions():
+            for st in (tr.src, tr.dest):
+                if st not in index:
+                    index[st] = len(index)
+            if tr.symbol not in symbols:
+                symbols[tr.symbol] = len(symbols)
+        for st in aut.get_finals().keys():
+            if st not in index:
+                index[st] = len(index)
+
+        trans = [[-1]*len(symbols) for _ in range(len(index))]
+        logw = [[NO_WEIGHT]*len(symbols) for _ in range(len(index))]
+        finals = [NO_WEIGHT]*len(index)
+        for tr in aut.get_transitions():
+            src, col = index[tr.src], symbols[tr.symbol]
+            if trans[src][col] >= 0:
+                continue
+            trans[src][col] = index[tr.dest]
+            if tr.weight > 0:
+                logw[src][col] = math.log(tr.weight)
+        for st, w in aut.get_finals().items():
+            if w > 0:
+                finals[index[st]] = math.log(w)
+
+        start = NO_WEIGHT
+        for w in list(aut.get_starts().values())[:1]:
+            if w > 0:
+                start = math.log(w)
+        if len(index) == 0:
+            return ArrayDPA(symbols, [[]], [[]], [NO_WEIGHT], NO_WEIGHT)
+        return ArrayDPA(symbols, trans, logw, finals, start)
+
+
+    def get_state_count(self) -> int:
+        """!
+        Get the number of states
+
+        @return Number of states
+        """
+        return len(self._finals_lst)
+
+
+    def string_prob(self, word: List[Any]) -> Optional[float]:
+        """!
+        Compute the log-probability of the word (the same value as
+        CoreWFA.string_prob_deterministic).
+
+        @param word: Word
+
+        @return Log-probability of the word (None if the word is rejected)
+        """
+        if self.start == NO_WEIGHT:
+            return None
+        prob = self.start
+        act = 0
+        for sym in word:
+            col = self.symbols.get(sym)
+            if col is None:
+                return None
+            w = self._logw_rows[act][col]
+            act = self._trans_rows[act][col]
+            if act < 0 or w == NO_WEIGHT:
+                return None
+            prob += w
+        if self._finals_lst[act] == NO_WEIGHT:
+            return None
+        return prob + self._finals_lst[act]
+
+
+    def score_batch(self, words: List[List[Any]]) -> List[Optional[float]]:
+        """!
+        Compute log-probabilities of a batch of words. Identical words are
+        scored once and distinct words are processed in the order of a trie
+        traversal, so each shared prefix of neighbouring words is processed
+        only once.
+
+        @param words: List of words
+
+        @return Log-probabilities of words in the input order (None for
+            rejected words)
+        """
+        ret: List[Optional[float]] = [None]*len(words)
+        if self.start == NO_WEIGHT:
+            return ret
+        # identical words are scored once
+        uniq: dict[Tuple, List[int]] = dict()
+        for i, word in enumerate(words):
+            uniq.setdefault(tuple(word), []).append(i)
+        try:
+            order = sorted(uniq)
+        except TypeError:
+            order = list(uniq)
+
+        # words in the lexicographic order correspond to a depth-first traversal
+        # of the trie; states and log-probabilities along the path to the
+        # previous word are kept and the common prefix is not processed again
+        states = [0]
+        probs = [self.start]
+        prev: Tuple = tuple()
+        for word in order:
+            lim = min(len(word), len(prev), len(states) - 1)
+            k = 0
+            while k < lim and word[k] == prev[k]:
+                k += 1
+            del states[k+1:]
+            del probs[k+1:]
+            prev = word
+
+            act, prob = states[k], probs[k]
+            for j in range(k, len(word)):
+                col = self.symbols.get(word[j])
+                if col is None:
+                    break
+                w = self._logw_rows[act][col]
+                act = self._trans_rows[act][col]
+                if act < 0 or w == NO_WEIGHT:
+                    break
+                prob += w
+                states.append(act)
+                probs.append(prob)
+            else:
+                if self._finals_lst[act] != NO_WEIGHT:
+                    fin = prob + self._finals_lst[act]
+                    for i in uniq[word]:
+                        ret[i] = fin
+        return ret
+
+
+    def encode(self, words: List[List[Any]], padded: bool = False) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """!
+        Encode words to integer arrays (symbols are replaced by their column
+        indices, symbols not occurring in the automaton by -1).
+
+        @param words: List of words
+        @param padded: Return padded 2D array of codes with lengths instead of
+            the ragged representation
+
+        @return Pair (offsets, values) (the i-th word is
+            values[offsets[i]:offsets[i+1]]) or (codes, lengths) if padded
+        """
+        lengths = numpy.array([len(word) for word in words], dtype=numpy.int64)
+        values = numpy.array([self.symbols.get(sym, -1) for word in words for sym in word], dtype=numpy.int64)
+        if not padded:
+            offsets = numpy.zeros(len(words) + 1, dtype=numpy.int64)
+            numpy.cumsum(lengths, out=offsets[1:])
+            return offsets, values
+
+        codes = numpy.full((len(words), lengths.max(initial=0)), -1, dtype=numpy.int64)
+        mask = numpy.arange(codes.shape[1]) < lengths[:, None]
+        codes[mask] = values
+        return codes, lengths
+
+
+    def score_padded(self, codes: numpy.ndarray, lengths: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """!
+        Vectorized scoring of words padded into a 2D array (all words are
+        advanced by one symbol in each step).
+
+        @param codes: Encoded words (one word per row, see encode)
+        @param lengths: Lengths of words
+
+        @return Pair (log-likelihoods, rejected mask); rejected words have the
+            log-likelihood -inf
+        """
+        return self._score_vectorized(lengths, lambda idx, t: codes[idx, t])
+
+
+    def score_ragged(self, offsets: numpy.ndarray, values: numpy.ndarray) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """!
+        Vectorized scoring of words given by offsets and concatenated values
+        (all words are advanced by one symbol in each step).
+
+        @param offsets: Offsets of words in values (length is the number of
+            words + 1, see encode)
+        @param values: Concatenated encoded words
+
+        @return Pair (log-likelihoods, rejected mask); rejected words have the
+            log-likelihood -inf
+        """
+        starts = offsets[:-1]
+        return self._score_vectorized(numpy.diff(offsets), lambda idx, t: values[starts[idx] + t])
+
+
+    def _score_vectorized(self, lengths: numpy.ndarray, symbols_at: Callable) -> Tuple[numpy.ndarray, numpy.ndarray]:
+        """!
+        Advance all words through the transition tables at once
+
+        @param lengths: Lengths of words
+        @param symbols_at: Function returning codes of the t-th symbols of
+            words with the given indices
+
+        @return Pair (log-likelihoods, rejected mask)
+        """
+        count = len(lengths)
+        prob = numpy.full(count, self.start, dtype=numpy.float64)
+        rejected = numpy.full(count, self.start == NO_WEIGHT, dtype=bool)
+        state = numpy.zeros(count, dtype=numpy.int64)
+
+        # the extra column handles symbols not occurring in the automaton
+        cols = len(self.symbols)
+        trans = numpy.hstack([self.trans, numpy.full((self.trans.shape[0], 1), -1, dtype=numpy.int64)])
+        logw = numpy.hstack([self.logw, numpy.full((self.logw.shape[0], 1), NO_WEIGHT)])
+
+        for t in range(lengths.max(initial=0)):
+            idx = numpy.flatnonzero((lengths > t) & ~rejected)
+            if len(idx) == 0:
+                break
+            syms = symbols_at(idx, t)
+            syms = numpy.where(syms < 0, cols, syms)
+            dest = trans[state[idx], syms]
+            w = logw[state[idx], syms]
+            bad = (dest < 0) | (w == NO_WEIGHT)
+            rejected[idx[bad]] = True
+            ok = idx[~bad]
+            state[ok] = dest[~bad]
+            prob[ok] += w[~bad]
+
+        fin = self.finals[state]
+        rejected |= (fin == NO_WEIGHT)
+        prob += fin
+        prob[rejected] = NO_WEIGHT
+        return prob, rejected
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+"""!
+\brief Array-backed weighted automata
+
+\details
+    Struct-of-arrays representation of WFAs. States are numbered from 0 to
+    n-1, symbols are interned to ids, and transitions are stored in parallel
+    arrays (source, destination, symbol id, weight) sorted by source states
+    together with CSR offsets (transitions leaving the state i are at
+    positions offsets[i]:offsets[i+1]). The representation is used for products
+    and for building matrices without creating an object for each transition.
+
+\author Vojtěch Havlena
+
+\copyright
+    Copyright (C) 2020  Vojtech Havlena, <ihavlena@fit.vutbr.cz>\n
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.\n
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.\n
+    You should have received a copy of the GNU General Public License.
+    If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import numpy
+import scipy.sparse
+import wfa.core_wfa as core_wfa
+
+from collections import deque
+from typing import List, Any, Iterator, Optional
+
+
+class ArrayWFA:
+    """!
+    WFA stored in parallel arrays with CSR offsets by source states
+    """
+
+    def __init__(self, states: List[Any], symbols: List[Any], src: numpy.ndarray, dest: numpy.ndarray, sym: numpy.ndarray, weight: numpy.ndarray, finals: numpy.ndarray, starts: numpy.ndarray):
+        """!
+        Constructor (transitions are sorted by source states, the order of
+        transitions leaving a state is preserved)
+
+        @param states: Labels of states (state i has the label states[i])
+        @param symbols: Symbols (symbol id i stands for symbols[i])
+        @param src: Source states of transitions
+        @param dest: Destination states of transitions
+        @param sym: Symbol ids of transitions
+        @param weight: Weights of transitions
+        @param finals: Final weight of each state (0.0 for non-final states)
+        @param starts: Initial weight of each state (0.0 for non-initial states)
+        """
+        ## Labels of states
+        self.states = states
+        ## Symbols (indexed by symbol ids)
+        self.symbols = symbols
+        order = numpy.argsort(src, kind="stable")
+        ## Source states
+        self.src = numpy.asarray(src, dtype=numpy.int64)[order]
+        ## Destination states
+        self.dest = numpy.asarray(dest, dtype=numpy.int64)[order]
+        ## Symbol ids
+        self.sym = numpy.asarray(sym, dtype=numpy.int64)[order]
+        ## Weights
+        self.weight = numpy.asarray(weight, dtype=numpy.float64)[order]
+        ## Final weights of states
+        self.finals = numpy.asarray(finals, dtype=numpy.float64)
+        ## Initial weights of states
+        self.starts = numpy.asarray(starts, dtype=numpy.float64)
+        ## CSR offsets of transitions by source states
+        self.offsets = numpy.zeros(len(states) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(self.src, minlength=len(states)), out=self.offsets[1:])
+
+
+    @staticmethod
+    def from_wfa(aut: core_wfa.CoreWFA, numbered: bool = False) -> "ArrayWFA":
+        """!
+        Convert a WFA (object API) to the array form.
+
+        @param aut: WFA
+        @param numbered: States of the WFA are numbers 0..n-1, which are kept
+            (otherwise, initial states come first and the remaining states are
+            numbered in the order of their occurrence)
+
+        @return Array-backed WFA
+        """
+        if numbered:
+            index = dict([(st, st) for st in range(len(aut.get_states()))])
+        else:
+            index = dict()
+            for st in list(aut.get_starts().keys()) + list(aut.get_finals().keys()):
+                if st not in index:
+                    index[st] = len(index)
+            for tr in aut.get_transitions():
+                for st in (tr.src, tr.dest):
+                    if st not in index:
+                        index[st] = len(index)
+
+        symbols: dict[Any, int] = dict()
+        for sym in aut.get_alphabet():
+            symbols.setdefault(sym, len(symbols))
+        transitions = aut.get_transitions()
+        src = numpy.fromiter((index[tr.src] for tr in transitions), dtype=numpy.int64, count=len(transitions))
+        dest = numpy.fromiter((index[tr.dest] for tr in transitions), dtype=numpy.int64, count=len(transitions))
+        sym = numpy.fromiter((symbols.setdefault(tr.symbol, len(symbols)) for tr in transitions), dtype=numpy.int64, count=len(transitions))
+        weight = numpy.fromiter((tr.weight for tr in transitions), dtype=numpy.float64, count=len(transitions))
+
+        finals = numpy.zeros(len(index))
+        for st, w in aut.get_finals().items():
+            finals[index[st]] = w
+        starts = numpy.zeros(len(index))
+        for st, w in aut.get_starts().items():
+            starts[index[st]] = w
+
+        states = [None]*len(index)
+        for st, i in index.items():
+            states[i] = st
+        return ArrayWFA(states, list(symbols.keys()), src, dest, sym, weight, finals, starts)
+
+
+    def get_state_count(self) -> int:
+        """!
+        Get the number of states
+
+        @return Number of states
+        """
+        return len(self.states)
+
+
+    def iter_transitions(self, labels: bool = True) -> Iterator[core_wfa.Transition]:
+        """!
+        Iterate over transitions as objects (adapter for the object API).
+
+        @param labels: Use labels of states (otherwise numbers of states)
+
+        @return Iterator over transitions
+        """
+        src, dest, sym, weight = self.src.tolist(), self.dest.tolist(), self.sym.tolist(), self.weight.tolist()
+        for i in range(len(src)):
+            if labels:
+                yield core_wfa.Transition(self.states[src[i]], self.states[dest[i]], self.symbols[sym[i]], weight[i])
+            else:
+                yield core_wfa.Transition(src[i], dest[i], self.symbols[sym[i]], weight[i])
+
+
+    def to_wfa(self, cls: type = core_wfa.CoreWFA, labels: bool = True) -> core_wfa.CoreWFA:
+        """!
+        Convert to a WFA with the object API (adapter).
+
+        @param cls: Class of the resulting WFA (CoreWFA or its subclass)
+        @param labels: Use labels of states (otherwise numbers of states)
+
+        @return WFA
+        """
+        name = (lambda st: self.states[st]) if labels else (lambda st: st)
+        finals = dict([(name(st), float(self.finals[st])) for st in numpy.flatnonzero(self.finals).tolist()])
+        starts = dict([(name(st), float(self.starts[st])) for st in numpy.flatnonzero(self.starts).tolist()])
+        return cls(list(self.iter_transitions(labels)), finals, starts, list(self.symbols))
+
+
+    def product(self, aut: "ArrayWFA") -> "ArrayWFA":
+        """!
+        Product of two array-backed WFAs. Pairs of states reachable from the
+        initial pairs are numbered in the order of discovery (initial pairs
+        first), the label of a product state is the pair of labels.
+
+        @param aut: Second WFA
+
+        @return Product WFA
+        """
+        sym_map = dict([(sym, i) for i, sym in enumerate(aut.symbols)])
+        conv = [sym_map.get(sym, -1) for sym in self.symbols]
+        symbols = [sym for sym in self.symbols if sym in sym_map]
+        ids = dict([(sym, i) for i, sym in enumerate(symbols)])
+        sym_ids = [ids.get(sym, -1) for sym in self.symbols]
+
+        off1, dest1, sym1, w1 = self.offsets.tolist(), self.dest.tolist(), self.sym.tolist(), self.weight.tolist()
+        off2, dest2, sym2, w2 = aut.offsets.tolist(), aut.dest.tolist(), aut.sym.tolist(), aut.weight.tolist()
+        # transitions of the second WFA grouped by symbols (per state)
+        rows2: dict[int, dict[int, List[int]]] = dict()
+
+        index: dict = dict()
+        queue: deque = deque()
+        src, dest, sym, weight = [], [], [], []
+        starts: dict[int, float] = dict()
+
+        def state_of(pair):
+            st = index.get(pair)
+            if st is None:
+                st = len(index)
+                index[pair] = st
+                queue.append(pair)
+            return st
+
+        for st1 in numpy.flatnonzero(self.starts).tolist():
+            for st2 in numpy.flatnonzero(aut.starts).tolist():
+                starts[state_of((st1, st2))] = self.starts[st1] * aut.starts[st2]
+
+        while queue:
+            act = queue.popleft()
+            act_src = index[act]
+            row2 = rows2.get(act[1])
+            if row2 is None:
+                row2 = dict()
+                for j in range(off2[act[1]], off2[act[1]+1]):
+                    row2.setdefault(sym2[j], []).append(j)
+                rows2[act[1]] = row2
+            for i in range(off1[act[0]], off1[act[0]+1]):
+                if conv[sym1[i]] < 0:
+                    continue
+                for j in row2.get(conv[sym1[i]], []):
+                    src.append(act_src)
+                    dest.append(state_of((dest1[i], dest2[j])))
+                    sym.append(sym_ids[sym1[i]])
+                    weight.append(w1[i] * w2[j])
+
+        states = [None]*len(index)
+        finals = numpy.zeros(len(index))
+        start_vec = numpy.zeros(len(index))
+        for (st1, st2), st in index.items():
+            states[st] = (self.states[st1], aut.states[st2])
+            finals[st] = self.finals[st1] * aut.finals[st2]
+        for st, w in starts.items():
+            start_vec[st] = w
+        return ArrayWFA(states, symbols, numpy.array(src, dtype=numpy.int64), \
+            numpy.array(dest, dtype=numpy.int64), numpy.array(sym, dtype=numpy.int64), \
+            numpy.array(weight, dtype=numpy.float64), finals, start_vec)
+
+
+    def get_coaccessible_mask(self) -> numpy.ndarray:
+        """!
+        Get states from which a final state is reachable (backward search over
+        transitions in the CSC order).
+
+        @return Boolean mask of coaccessible states
+        """
+        order = numpy.argsort(self.dest, kind="stable")
+        preds = self.src[order].tolist()
+        offsets = numpy.zeros(len(self.states) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(self.dest, minlength=len(self.states)), out=offsets[1:])
+        offsets = offsets.tolist()
+
+        mask = self.finals != 0.0
+        stack = numpy.flatnonzero(mask).tolist()
+        while stack:
+            act = stack.pop()
+            for src in preds[offsets[act]:offsets[act+1]]:
+                if not mask[src]:
+                    mask[src] = True
+                    stack.append(src)
+        return mask
+
+
+    def restrict(self, mask: numpy.ndarray) -> "ArrayWFA":
+        """!
+        Restrict the WFA to the given states (the states are renumbered
+        preserving their order).
+
+        @param mask: Boolean mask of kept states
+
+        @return Restricted WFA
+        """
+        ren = numpy.cumsum(mask) - 1
+        sel = mask[self.src] & mask[self.dest]
+        keep = numpy.flatnonzero(mask).tolist()
+        return ArrayWFA([self.states[st] for st in keep], self.symbols, ren[self.src[sel]], \
+            ren[self.dest[sel]], self.sym[sel], self.weight[sel], self.finals[mask], self.starts[mask])
+
+
+    def get_transition_matrix(self, sparse: bool = False) -> Any:
+        """!
+        Get the transition matrix (weights of parallel transitions are summed).
+
+        @param sparse: Use sparse matrices
+
+        @return Transition matrix (numpy.matrix or scipy.sparse.csr_matrix)
+        """
+        num = len(self.states)
+        if sparse:
+            return scipy.sparse.csr_matrix((self.weight, (self.src, self.dest)), shape=(num, num), dtype=numpy.float64)
+        mtx = numpy.zeros((num, num))
+        numpy.add.at(mtx, (self.src, self.dest), self.weight)
+        return numpy.matrix(mtx)
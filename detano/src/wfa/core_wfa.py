@@ -27,10 +27,13 @@
 import copy
 import bidict
 import math
+import heapq
+import hashlib
 import wfa.wfa_exceptions as wfa_exceptions
+import wfa.array_dpa as array_dpa
 
-from typing import List, Optional, Set, TypeVar, Generic, Callable
-from collections import deque, defaultdict
+from typing import Any, List, Optional, Set, Tuple, TypeVar, Generic, Callable
+from collections import deque
 
 StateType = TypeVar("StateType")
 SymbolType = TypeVar("SymbolType")
@@ -43,6 +46,8 @@ class Transition(Generic[StateType, SymbolType]):
     Class for the represention of a WFA transition.
     """
 
+    __slots__ = ("src", "dest", "symbol", "weight")
+
     def __init__(self, src: StateType, dest: StateType, sym: SymbolType, weight: float):
         """!
         Constructor
@@ -56,7 +61,6 @@ class Transition(Generic[StateType, SymbolType]):
         self.dest = dest
         self.symbol = sym
         self.weight = weight
-        self.count = 0
 
 
     def __str__(self) -> str:
@@ -142,6 +146,7 @@ class CoreWFA(Generic[StateType, SymbolType]):
         # else:
         self._start = start
         self._states_dict = None
+        self._indexes: dict[str, Any] = dict()
 
         self._alphabet: List[SymbolType] = []
         if alphabet is None:
@@ -149,6 +154,70 @@ class CoreWFA(Generic[StateType, SymbolType]):
         else:
             self._alphabet = alphabet
         self._states: List[StateType] = self._get_states()
+        self._dpa: Optional[array_dpa.ArrayDPA] = None
+        self._frozen = False
+
+
+    def invalidate(self) -> None:
+        """!
+        Drop structures derived from the automaton (transition indexes, the
+        compiled DPA). Called by all modifying methods; has to be called
+        explicitly after an in-place modification of the transitions, finals or
+        starts returned by the getters.
+        """
+        self._dpa = None
+        self._indexes = dict()
+
+
+    def freeze(self) -> "CoreWFA":
+        """!
+        Make the WFA immutable (modifying methods raise WFAOperationException).
+        A frozen WFA can be shared (e.g., by cached learning results and
+        anomaly reports) without copying.
+
+        @return The frozen WFA (self)
+        """
+        self._frozen = True
+        return self
+
+
+    def is_frozen(self) -> bool:
+        """!
+        Is the WFA immutable
+
+        @return True -- the WFA is frozen
+        """
+        return self._frozen
+
+
+    def _check_mutable(self) -> None:
+        """!
+        Raise an exception if the WFA is frozen (called by modifying methods).
+        """
+        if self._frozen:
+            raise wfa_exceptions.WFAOperationException("Frozen WFA cannot be modified.")
+
+
+    def get_compiled_dpa(self) -> array_dpa.ArrayDPA:
+        """!
+        Get the automaton compiled to an array-backed DPA (cached until the
+        automaton is modified).
+
+        @return Array-backed DPA
+        """
+        if self._dpa is None:
+            self._dpa = array_dpa.ArrayDPA.from_wfa(self)
+        return self._dpa
+
+
+    def set_compiled_dpa(self, dpa: array_dpa.ArrayDPA) -> None:
+        """!
+        Set the array-backed DPA of the automaton (e.g., compiled directly by a
+        learner; dropped when the automaton is modified).
+
+        @param dpa: Array-backed DPA equivalent to the automaton
+        """
+        self._dpa = dpa
 
 
     def __eq__(self, other: object) -> bool:
@@ -176,6 +245,48 @@ class CoreWFA(Generic[StateType, SymbolType]):
         return hash((tuple(self._transitions), tuple(self._finals), tuple(self._start), tuple(self._alphabet)))
 
 
+    def get_fingerprint(self) -> str:
+        """!
+        Get a canonical fingerprint of the WFA. States reachable from the
+        initial states are numbered in the BFS order, where the outgoing
+        transitions of a state are visited sorted by symbols and weights. The
+        renumbered initial states, final states and transitions are sorted and
+        hashed. Hence, the fingerprint does not depend on the state labels and
+        the order of transitions (for deterministic WFAs, equal fingerprints
+        mean identical automata up to state renaming). The fingerprint is
+        cached.
+
+        @return Fingerprint (hexadecimal digest)
+        """
+        try:
+            return self._indexes["fingerprint"]
+        except KeyError:
+            pass
+
+        tr_dict = self.get_dictionary_transitions()
+        index: dict[StateType, int] = dict()
+        queue: deque = deque()
+        for st, _ in sorted(self._start.items(), key=lambda x: repr(float(x[1]))):
+            if st not in index:
+                index[st] = len(index)
+                queue.append(st)
+        while queue:
+            act = queue.popleft()
+            for tr in sorted(tr_dict.get(act, []), key=lambda x: (repr(x.symbol), repr(float(x.weight)))):
+                if tr.dest not in index:
+                    index[tr.dest] = len(index)
+                    queue.append(tr.dest)
+
+        transitions = sorted((index[tr.src], repr(tr.symbol), index[tr.dest], repr(float(tr.weight))) \
+            for st in index for tr in tr_dict.get(st, []))
+        finals = sorted((index[st], repr(float(w))) for st, w in self._finals.items() if st in index)
+        starts = sorted((index[st], repr(float(w))) for st, w in self._start.items())
+        alphabet = sorted(repr(sym) for sym in self.get_alphabet())
+        content = repr((starts, finals, transitions, alphabet))
+        self._indexes["fingerprint"] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        return self._indexes["fingerprint"]
+
+
     def get_transitions(self) -> List[Transition]:
         """!
         Get all transitions of the WFA.
@@ -189,9 +300,11 @@ class CoreWFA(Generic[StateType, SymbolType]):
         """!
         Set all states to be final (all having the accepting weight 1.0)
         """
+        self._check_mutable()
         self._finals = dict()
         for st in self.get_states():
             self._finals[st] = 1.0
+        self.invalidate()
 
 
     def get_finals(self) -> StateFloatMapType:
@@ -209,7 +322,9 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @param finals: Dictionary of final states and their weight of accepting.
         """
+        self._check_mutable()
         self._finals = finals
+        self.invalidate()
 
 
     def get_starts(self) -> StateFloatMapType:
@@ -227,7 +342,9 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @param start: New initial state
         """
+        self._check_mutable()
         self._start = start
+        self.invalidate()
 
 
     def set_alphabet(self, alph: List[SymbolType]) -> None:
@@ -236,7 +353,9 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @param alph: New alphabet
         """
+        self._check_mutable()
         self._alphabet = alph
+        self.invalidate()
 
 
     def get_alphabet(self) -> List[SymbolType]:
@@ -246,12 +365,20 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @return List of symbols.
         """
-        alph: List[SymbolType] = []
         if self._alphabet != None and len(self._alphabet) > 0:
             return self._alphabet
+        try:
+            return self._indexes["alphabet"]
+        except KeyError:
+            pass
+
+        alph: List[SymbolType] = []
+        seen = set()
         for transition in self._transitions:
-            if transition.symbol not in alph:
+            if transition.symbol not in seen:
+                seen.add(transition.symbol)
                 alph.append(transition.symbol)
+        self._indexes["alphabet"] = alph
         return alph
 
 
@@ -261,11 +388,13 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @param dct: Mapping of the new symbols
         """
+        self._check_mutable()
         self._alphabet = None
         tran = list()
 
         self._transitions = list(map (lambda x: Transition(x.src, x.dest, \
             dct.inverse[x.symbol], x.weight), self._transitions))
+        self.invalidate()
 
 
     def _get_states(self) -> List[StateType]:
@@ -318,8 +447,14 @@ class CoreWFA(Generic[StateType, SymbolType]):
         symbol) in the form of dictinary (for each state there is a list of
         transitions leading from this state).
 
-        @return Dictionary assigning State -> List(Transitions)
+        @return Dictionary assigning State -> List(Transitions) (cached, do not
+            modify)
         """
+        try:
+            return self._indexes["single"]
+        except KeyError:
+            pass
+
         tr_dict: dict[StateType, List[Transition]] = dict()
         destinations: dict[StateType, Set[StateType]] = dict()
 
@@ -332,6 +467,7 @@ class CoreWFA(Generic[StateType, SymbolType]):
             if transition.dest not in destinations[transition.src]:
                 tr_dict[transition.src].append(transition)
                 destinations[transition.src].add(transition.dest)
+        self._indexes["single"] = tr_dict
         return tr_dict
 
 
@@ -340,8 +476,14 @@ class CoreWFA(Generic[StateType, SymbolType]):
         Get transitions in the form of dictionary (for each state there is a
         list of transitions leading from this state).
 
-        @return Dictionary assigning State -> List(Transitions)
+        @return Dictionary assigning State -> List(Transitions) (cached, do not
+            modify)
         """
+        try:
+            return self._indexes["dictionary"]
+        except KeyError:
+            pass
+
         tr_dict: dict[StateType, List[Transition]] = dict()
 
         states = self.get_states()
@@ -350,6 +492,7 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         for transition in self._transitions:
             tr_dict[transition.src].append(transition)
+        self._indexes["dictionary"] = tr_dict
         return tr_dict
 
 
@@ -358,8 +501,14 @@ class CoreWFA(Generic[StateType, SymbolType]):
         Get transitions in the form of dictionary (for each state there is a
         dictionary assigning to symbols a set of transitions)
 
-        @return Dictionary assigning State -> (Dictionary: Symbol -> Set of transitions)
+        @return Dictionary assigning State -> (Dictionary: Symbol -> Set of
+            transitions) (cached, do not modify)
         """
+        try:
+            return self._indexes["symbol"]
+        except KeyError:
+            pass
+
         tr_dict: TransFunctionType = dict()
 
         states = self.get_states()
@@ -371,6 +520,7 @@ class CoreWFA(Generic[StateType, SymbolType]):
                 tr_dict[transition.src][transition.symbol].add(transition)
             except KeyError:
                 tr_dict[transition.src][transition.symbol] = set([transition])
+        self._indexes["symbol"] = tr_dict
         return tr_dict
 
 
@@ -394,6 +544,7 @@ class CoreWFA(Generic[StateType, SymbolType]):
         is the number of states). The start state has number 0. The renamed and
         original states are stored in the states_dict dictionary.
         """
+        self._check_mutable()
         self._states_dict = dict()
         new_transitions = []
         new_finals = dict()
@@ -424,54 +575,56 @@ class CoreWFA(Generic[StateType, SymbolType]):
         self._finals = new_finals
         self._start = new_starts
         self._states = self._get_states()
+        self.invalidate()
 
 
     def product(self, aut: "CoreWFA") -> "CoreWFA":
         """!
-        Perform the product of two WFAs.
+        Perform the product of two WFAs. Each pair of states is expanded once;
+        outgoing transitions of a pair are obtained by joining the symbol
+        indexes of both states.
 
         @param aut: Second automaton for the product.
 
         @return WFA representing the product of WFAs
         """
-        #queue = deque([])
-        queue = []
         ret_finals = dict()
         ret_start = dict()
         ret_transitions = []
 
-        self_finals = set(self._finals.keys())
-        aut_finals = set(aut.get_finals().keys())
+        self_finals = self._finals
+        aut_finals = aut.get_finals()
+        sym_dict1 = self.get_state_symbol_dict()
+        sym_dict2 = aut.get_state_symbol_dict()
 
-        for st1, weight1 in self._start.items():
-            for st2, weight2 in aut.get_starts().items():
-                queue.append((st1, st2))
-                ret_start[(st1, st2)] = weight1 * weight2
+        visited: Set[Tuple[StateType, StateType]] = set()
+        queue: deque = deque()
 
-        finished = set([])
-        tr_dict1 = self.get_dictionary_transitions()
-        tr_dict2 = aut.get_dictionary_transitions()
+        def state_of(pair):
+            if pair not in visited:
+                visited.add(pair)
+                queue.append(pair)
+            return pair
 
-        while len(queue) > 0:
-            act = queue.pop(0)
-            finished.add(act)
-
-            if (act[0] in self_finals) \
-                and (act[1] in aut_finals):
-                ret_finals[act] = self._finals[act[0]] \
-                    * aut.get_finals()[act[1]]
+        for st1, weight1 in self._start.items():
+            for st2, weight2 in aut.get_starts().items():
+                ret_start[state_of((st1, st2))] = weight1 * weight2
 
-            for tr1 in tr_dict1[act[0]]:
-                for tr2 in tr_dict2[act[1]]:
-                    if tr2.symbol != tr1.symbol:
-                        continue
+        while queue:
+            act = queue.popleft()
 
-                    dest_state = (tr1.dest, tr2.dest)
-                    ret_transitions.append(Transition(act, dest_state, \
-                        tr1.symbol, tr1.weight * tr2.weight))
+            if (act[0] in self_finals) and (act[1] in aut_finals):
+                ret_finals[act] = self_finals[act[0]] * aut_finals[act[1]]
 
-                    if (dest_state not in finished): #and (dest_state not in queue):
-                        queue.append(dest_state)
+            syms2 = sym_dict2.get(act[1], dict())
+            for sym, trs1 in sym_dict1.get(act[0], dict()).items():
+                trs2 = syms2.get(sym)
+                if trs2 is None:
+                    continue
+                for tr1 in trs1:
+                    for tr2 in trs2:
+                        ret_transitions.append(Transition(act, state_of((tr1.dest, tr2.dest)), \
+                            sym, tr1.weight * tr2.weight))
 
         alphabet = set(self.get_alphabet()) & set(aut.get_alphabet())
         return CoreWFA(ret_transitions, ret_finals, ret_start, list(alphabet))
@@ -487,32 +640,48 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @return Out parameter visited (the list of visited states).
         """
+        if state in visited:
+            return
         queue = deque([state])
+        visited.add(state)
         if tr_dict is None:
             tr_dict = self.get_single_dictionary_transitions()
         while queue:
             head = queue.popleft()
-            visited.add(head)
             for transition in tr_dict[head]:
-                if (transition.dest not in visited) \
-                    and (transition.dest not in queue):
+                if transition.dest not in visited:
+                    visited.add(transition.dest)
                     queue.append(transition.dest)
 
 
     def get_coaccessible_states(self, tr_dict: Optional[dict[StateType, List[Transition]]]=None) -> Set[StateType]:
         """!
-        Get coaccessible states of the WFA.
+        Get coaccessible states of the WFA (the states are found by a backward
+        search over the predecessor index).
 
-        @param tr_dict: Transition dictionary.
+        @param tr_dict: Transition dictionary of the reversed automaton (if
+            None, the cached predecessor index is used).
 
         @return The list of coaccessible states.
         """
         visited: Set[StateType] = set([])
-        reverse_aut = self.get_rev_transitions_aut()
-        if tr_dict is None:
-            tr_dict = reverse_aut.get_single_dictionary_transitions()
-        for state, _ in reverse_aut.get_finals().items():
-            reverse_aut.breadth_first_search(state, visited, tr_dict)
+        if tr_dict is not None:
+            for state in self.get_finals().keys():
+                self.breadth_first_search(state, visited, tr_dict)
+            return visited
+
+        pred = self.get_predecessors_transitions()
+        queue = deque()
+        for state in self.get_finals().keys():
+            if state not in visited:
+                visited.add(state)
+                queue.append(state)
+        while queue:
+            head = queue.popleft()
+            for transition in pred[head]:
+                if transition.src not in visited:
+                    visited.add(transition.src)
+                    queue.append(transition.src)
         return visited
 
 
@@ -573,10 +742,53 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @return Trimmed WFA.
         """
-        sts = self.get_coaccessible_states() & self.get_accessible_states()
+        sts = self.get_accessible_states()
+        sts.intersection_update(self.get_coaccessible_states())
         return self.get_automata_restriction(sts)
 
 
+    def minimize(self) -> None:
+        """!
+        Minimize the deterministic WFA (in place) by merging probabilistically
+        bisimilar states, i.e., states with the same final weight and, for each
+        symbol, the same weight of the transition leading to equivalent states.
+        The equivalence is computed by partition refinement (starting from the
+        partition given by final weights, classes are split according to
+        signatures of states until the partition is stable). Each class is
+        represented by its first state (initial states first).
+        """
+        self._check_mutable()
+        assert(self.is_deterministic())
+
+        order = list(self._start.keys()) + [st for st in self.get_states() if st not in self._start]
+        tr_dict = self.get_dictionary_transitions()
+        sig: dict = dict()
+        cls: dict[StateType, int] = dict()
+        for st in order:
+            cls[st] = sig.setdefault(self._finals.get(st), len(sig))
+
+        count = 0
+        while count != len(sig):
+            count = len(sig)
+            sig = dict()
+            new: dict[StateType, int] = dict()
+            for st in order:
+                key = (cls[st], frozenset([(tr.symbol, tr.weight, cls[tr.dest]) for tr in tr_dict.get(st, [])]))
+                new[st] = sig.setdefault(key, len(sig))
+            cls = new
+
+        rep: dict[int, StateType] = dict()
+        for st in order:
+            rep.setdefault(cls[st], st)
+        reps = set(rep.values())
+        self._transitions = [Transition(tr.src, rep[cls[tr.dest]], tr.symbol, tr.weight) \
+            for tr in self._transitions if tr.src in reps]
+        self._finals = dict([(st, w) for st, w in self._finals.items() if st in reps])
+        self._start = dict([(rep[cls[st]], w) for st, w in self._start.items()])
+        self._states = self._get_states()
+        self.invalidate()
+
+
     def get_predecessors(self, state: StateType) -> Set[StateType]:
         """!
         Operation that finds predessors of the state state.
@@ -597,8 +809,13 @@ class CoreWFA(Generic[StateType, SymbolType]):
         """!
         Get predecessors of all states of the WFA.
 
-        @return Dict: State -> List(State)
+        @return Dict: State -> List(Transition) (cached, do not modify)
         """
+        try:
+            return self._indexes["predecessors"]
+        except KeyError:
+            pass
+
         predecessors: dict[StateType, List[Transition]] = {}
         for state in self.get_states():
             predecessors[state] = []
@@ -606,6 +823,7 @@ class CoreWFA(Generic[StateType, SymbolType]):
         for transition in self.get_transitions():
             predecessors[transition.dest].append(transition)
 
+        self._indexes["predecessors"] = predecessors
         return predecessors
 
 
@@ -627,27 +845,26 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
     def string_prob_deterministic(self, word: List[SymbolType]) -> Optional[float]:
         """!
-        Compute the probability of the word word.
+        Compute the probability of the word word (using the compiled DPA).
 
         @param word: Word
 
-        @return Probability of word
+        @return Log-probability of word (None if the word is rejected)
         """
-        prob = 0.0
-        tr_dict = self.get_state_symbol_dict()
-        act = list(self._start.keys())[0]
-        prob = math.log(self._start[act])
-        try:
-            for sym in word:
-                n_tr = list(tr_dict[act][sym])[0]
-                prob += math.log(n_tr.weight)
-                act = n_tr.dest
-            prob += math.log(self._finals[act])
-        except ValueError:
-            return None
-        except KeyError:
-            return None
-        return prob
+        return self.get_compiled_dpa().string_prob(word)
+
+
+    def score_batch(self, conversations: List[List[SymbolType]]) -> List[Optional[float]]:
+        """!
+        Compute probabilities of a batch of words (shared prefixes of the words
+        are processed only once).
+
+        @param conversations: List of words
+
+        @return Log-probabilities of words in the input order (None for
+            rejected words)
+        """
+        return self.get_compiled_dpa().score_batch(conversations)
 
 
     def map_symbols(self, fnc: Callable):
@@ -656,49 +873,155 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @param fnc: Function applied on symbols
         """
+        self._check_mutable()
         for tr in self.get_transitions():
             tr.symbol = fnc(tr.symbol)
+        self.invalidate()
 
 
-    def get_most_probable_string(self) -> List[SymbolType]:
+    def _get_final_costs(self) -> Tuple[dict[StateType, float], dict[StateType, Transition]]:
         """!
-        Compute the most probable word of the DPA
+        Shortest-path search (Dijkstra) in the -log space from the final states
+        backwards. For each state, compute the -log of the highest weight of a
+        path to a final state (including the final weight), together with the
+        first transition of such a path.
 
-        @return A word with a highest probability
+        @return Pair (State -> cost, State -> first transition of the best
+            path; final states ending the best path have no transition)
         """
+        pred = self.get_predecessors_transitions()
+        cost: dict[StateType, float] = dict()
+        succ: dict[StateType, Transition] = dict()
+        heap: List[Tuple[float, int, StateType]] = []
+        done: Set[StateType] = set()
+        cnt = 0
+
+        for st, weight in self._finals.items():
+            if weight > 0.0:
+                cost[st] = -math.log(weight)
+                heapq.heappush(heap, (cost[st], cnt, st))
+                cnt += 1
+
+        while heap:
+            dist, _, act = heapq.heappop(heap)
+            if act in done:
+                continue
+            done.add(act)
+            for tr in pred.get(act, []):
+                if tr.weight <= 0.0 or tr.src in done:
+                    continue
+                new = dist - math.log(tr.weight)
+                if new < cost.get(tr.src, math.inf):
+                    cost[tr.src] = new
+                    succ[tr.src] = tr
+                    heapq.heappush(heap, (new, cnt, tr.src))
+                    cnt += 1
+        return cost, succ
+
+
+    def _path_weight(self, path: List[Transition]) -> float:
+        """!
+        Compute the weight of a path ending in a final state (the product of the
+        final weight and weights of transitions).
 
-        assert(self.is_deterministic())
+        @param path: List of transitions
 
-        val: dict[StateType, float] = defaultdict(lambda: 0.0)
-        words: dict[StateType, List[SymbolType]] = dict()
+        @return Weight of the path
+        """
+        last = path[-1].dest if len(path) > 0 else list(self._start.keys())[0]
+        val = self._finals[last]
+        for tr in reversed(path):
+            val = val*tr.weight
+        return val
+
+
+    def get_most_probable_string(self) -> Tuple[List[SymbolType], float]:
+        """!
+        Compute the most probable word of the DPA (shortest-path search in the
+        -log space, see _get_final_costs)
+
+        @return A word with a highest probability together with its probability
+        """
+
+        assert(self.is_deterministic())
 
         if len(self._finals) == 0:
             return [], 0.0
 
-        for k, v in self._finals.items():
-            val[k] = v
-            words[k] = []
+        ini = list(self._start.keys())[0]
+        cost, succ = self._get_final_costs()
+        if ini not in cost:
+            return [], 0.0
+
+        path: List[Transition] = []
+        act = ini
+        while act in succ:
+            path.append(succ[act])
+            act = succ[act].dest
+        return [tr.symbol for tr in path], self._path_weight(path)
+
+
+    def get_k_most_probable_strings(self, k: int) -> List[Tuple[List[SymbolType], float]]:
+        """!
+        Compute k most probable words of the DPA (ordered by the probability).
+        Paths are extended in the best-first order guided by the exact costs
+        of the best completions (see _get_final_costs), so only prefixes of the
+        resulting words are expanded.
 
-        changed = True
-        while changed:
-            changed = False
-            for tr in self.get_transitions():
-                if val[tr.src] < val[tr.dest]*tr.weight:
-                    val[tr.src] = val[tr.dest]*tr.weight
-                    words[tr.src] = [tr.symbol] + words[tr.dest]
-                    changed = True
+        @param k: Number of words
+
+        @return List of at most k pairs (word, probability)
+        """
+
+        assert(self.is_deterministic())
+
+        ret: List[Tuple[List[SymbolType], float]] = []
+        if len(self._finals) == 0 or len(self._start) == 0 or k <= 0:
+            return ret
 
         ini = list(self._start.keys())[0]
-        return words[ini], val[ini]
+        cost, _ = self._get_final_costs()
+        if ini not in cost:
+            return ret
+        tr_dict = self.get_dictionary_transitions()
+
+        # heap items: (estimated cost, counter, cost of the prefix, state, path
+        # as a linked list (transition, parent), complete word)
+        heap: List[Tuple] = [(cost[ini], 0, 0.0, ini, None, False)]
+        cnt = 1
+        while heap and len(ret) < k:
+            _, _, dist, act, node, complete = heapq.heappop(heap)
+            if complete:
+                path: List[Transition] = []
+                while node is not None:
+                    path.append(node[0])
+                    node = node[1]
+                path.reverse()
+                ret.append(([tr.symbol for tr in path], self._path_weight(path)))
+                continue
+
+            fin = self._finals.get(act, 0.0)
+            if fin > 0.0:
+                heapq.heappush(heap, (dist - math.log(fin), cnt, dist, act, node, True))
+                cnt += 1
+            for tr in tr_dict.get(act, []):
+                if tr.weight <= 0.0 or tr.dest not in cost:
+                    continue
+                new = dist - math.log(tr.weight)
+                heapq.heappush(heap, (new + cost[tr.dest], cnt, new, tr.dest, (tr, node), False))
+                cnt += 1
+        return ret
 
 
     def set_ones(self) -> None:
         """!
         Set the weight of all transitions to 1.0
         """
+        self._check_mutable()
 
         for tr in self._transitions:
             tr.weight = 1.0
+        self.invalidate()
 
 
     def complete_wfa(self, trap: StateType) -> None:
@@ -707,6 +1030,7 @@ class CoreWFA(Generic[StateType, SymbolType]):
 
         @param trap: New trap (sink) state (assuming not to be in the set of states)
         """
+        self._check_mutable()
 
         alphabet = self.get_alphabet()
         trans = copy.deepcopy(self._transitions)
@@ -727,33 +1051,63 @@ class CoreWFA(Generic[StateType, SymbolType]):
             trans.append(Transition(trap, trap, al, 0.0))
         self._transitions = trans
         self._states = self._get_states()
+        self.invalidate()
 
 
-    def difference_dwfa(self, diff: "CoreWFA") -> "CoreWFA":
+    def difference_dwfa(self, diff: "CoreWFA", trap: StateType = -1) -> "CoreWFA":
         """!
-        Compute the difference weighted automaton. First, convert the second
-        automaton to a complete WFA with all transitions 1.0. Then, switch the
-        accepting states to obtain a complementary automaton. Finally, return the
-        product with the original automaton.
+        Compute the difference weighted automaton, i.e., the product of the
+        automaton with the complement of the second automaton (with all
+        transitions 1.0). The completion of the second automaton is implicit:
+        a missing transition leads to the trap state, which is accepting in the
+        complement. Neither the completion nor a copy of the second automaton
+        is constructed.
 
         @param diff: Second automaton
+        @param trap: Label of the trap state (assuming not to be a state of
+            diff)
         @return Difference automaton
         """
 
         assert(self.is_deterministic())
         assert(diff.is_deterministic())
 
-        but = copy.deepcopy(diff)
+        ret_finals = dict()
+        ret_start = dict()
+        ret_transitions = []
+
+        self_finals = self._finals
+        diff_finals = diff.get_finals()
+        sym_dict1 = self.get_state_symbol_dict()
+        sym_dict2 = diff.get_state_symbol_dict()
+        no_trans: dict = dict()
 
-        alp = set(but.get_alphabet() + self.get_alphabet())
-        but.set_alphabet(list(alp))
-        but.complete_wfa(-1)
-        but.set_ones()
+        index: Set = set()
+        queue: deque = deque()
 
-        nfin = dict()
-        for st in but.get_states():
-            if st not in but.get_finals():
-                nfin[st] = 1.0
-        but.set_finals(nfin)
+        for st1, weight1 in self._start.items():
+            for st2, weight2 in diff.get_starts().items():
+                ret_start[(st1, st2)] = weight1 * weight2
+                if (st1, st2) not in index:
+                    index.add((st1, st2))
+                    queue.append((st1, st2))
 
-        return self.product(but).get_trim_automaton()
+        while queue:
+            act = queue.popleft()
+
+            if (act[0] in self_finals) and (act[1] not in diff_finals):
+                ret_finals[act] = self_finals[act[0]]
+
+            syms2 = sym_dict2.get(act[1], no_trans) if act[1] != trap else no_trans
+            for sym, trs1 in sym_dict1.get(act[0], no_trans).items():
+                trs2 = syms2.get(sym)
+                dest2 = trap if trs2 is None else next(iter(trs2)).dest
+                for tr1 in trs1:
+                    dest = (tr1.dest, dest2)
+                    if dest not in index:
+                        index.add(dest)
+                        queue.append(dest)
+                    ret_transitions.append(Transition(act, dest, sym, tr1.weight))
+
+        return CoreWFA(ret_transitions, ret_finals, ret_start, \
+            list(set(self.get_alphabet()))).get_trim_automaton()
@@ -29,10 +29,12 @@ import numpy
 import scipy.sparse
 import scipy.sparse.linalg
 import wfa.core_wfa as core_wfa
+import wfa.array_wfa as array_wfa
 import warnings
 from scipy.sparse import SparseEfficiencyWarning
 
 from enum import Enum
+from collections import deque
 from typing import List, Optional, Set, TypeVar, Generic, Callable
 
 StateType = int
@@ -44,6 +46,8 @@ TransFunctionType = dict[StateType, dict[SymbolType, Set[StateType]]]
 
 ## Threshold for sparse matrices
 THRESHOLD = 0.0
+## Maximum size of linear systems solved with dense matrices
+DENSE_LIMIT = 300
 
 ## Ignore a particular warning
 warnings.simplefilter('ignore', SparseEfficiencyWarning)
@@ -103,6 +107,152 @@ class MatrixWFA(core_wfa.CoreWFA):
         super(MatrixWFA, self).__init__(transitions, finals, start, alphabet)
 
 
+    @classmethod
+    def from_product(cls, aut1: core_wfa.CoreWFA, aut2: core_wfa.CoreWFA, trim: bool=False) -> "MatrixWFA":
+        """!
+        Compute the product of two WFAs with states numbered 0..n-1 (ready for
+        matrix operations without renaming).
+
+        @param aut1: First WFA
+        @param aut2: Second WFA
+        @param trim: Keep only states from which a final state is reachable
+            (and the initial states); the remaining states are renumbered
+            preserving their order
+
+        @return Product WFA
+        """
+        prod = array_wfa.ArrayWFA.from_wfa(aut1).product(array_wfa.ArrayWFA.from_wfa(aut2))
+        if trim:
+            prod = prod.restrict(prod.get_coaccessible_mask() | (prod.starts != 0.0))
+        return cls.from_arrays(prod)
+
+
+    @classmethod
+    def from_arrays(cls, arr: array_wfa.ArrayWFA) -> "MatrixWFA":
+        """!
+        Create a WFA from the array form (states are numbers of states in the
+        array form). Matrices of the WFA are built directly from the arrays.
+
+        @param arr: Array-backed WFA
+
+        @return WFA
+        """
+        aut = arr.to_wfa(cls, labels=False)
+        aut._indexes["arrays"] = arr
+        return aut
+
+
+    def get_arrays(self) -> array_wfa.ArrayWFA:
+        """!
+        Get the array form of the WFA (states of the WFA are used as numbers of
+        states in the array form). The array form is cached.
+
+        @return Array-backed WFA
+        """
+        try:
+            return self._indexes["arrays"]
+        except KeyError:
+            pass
+        if not self.are_states_compatible():
+            raise MatrixWFAOperationException("States must be renamed to the set {0,...,n}")
+        self._indexes["arrays"] = array_wfa.ArrayWFA.from_wfa(self, numbered=True)
+        return self._indexes["arrays"]
+
+
+    @staticmethod
+    def inner_product(aut1: core_wfa.CoreWFA, aut2: core_wfa.CoreWFA) -> float:
+        """!
+        Compute the inner product sum_w P_1(w)*P_2(w) of two WFAs directly
+        (without constructing the product WFA). The sparse linear system
+        (I - T)x = f is built over pairs of states reachable from the initial
+        pairs while exploring and restricted to pairs from which a final pair
+        is reachable (small systems are solved with dense matrices).
+
+        @param aut1: First WFA
+        @param aut2: Second WFA
+
+        @return Inner product of the weights of languages
+        """
+        sym_dict1 = aut1.get_state_symbol_dict()
+        sym_dict2 = aut2.get_state_symbol_dict()
+        finals1, finals2 = aut1.get_finals(), aut2.get_finals()
+
+        index: dict = dict()
+        queue: deque = deque()
+        rows, cols, vals = [], [], []
+        fin: dict[int, float] = dict()
+        ini: dict[int, float] = dict()
+
+        def state_of(pair):
+            st = index.get(pair)
+            if st is None:
+                st = len(index)
+                index[pair] = st
+                queue.append(pair)
+            return st
+
+        for st1, weight1 in aut1.get_starts().items():
+            for st2, weight2 in aut2.get_starts().items():
+                st = state_of((st1, st2))
+                ini[st] = ini.get(st, 0.0) + weight1 * weight2
+
+        while queue:
+            act = queue.popleft()
+            src = index[act]
+            if (act[0] in finals1) and (act[1] in finals2):
+                fin[src] = finals1[act[0]] * finals2[act[1]]
+
+            syms2 = sym_dict2.get(act[1], dict())
+            for sym, trs1 in sym_dict1.get(act[0], dict()).items():
+                trs2 = syms2.get(sym)
+                if trs2 is None:
+                    continue
+                for tr1 in trs1:
+                    for tr2 in trs2:
+                        rows.append(src)
+                        cols.append(state_of((tr1.dest, tr2.dest)))
+                        vals.append(tr1.weight * tr2.weight)
+
+        preds: dict[int, List[int]] = dict()
+        for src, dest in zip(rows, cols):
+            preds.setdefault(dest, []).append(src)
+        coreach = set([st for st, w in fin.items() if w != 0.0])
+        stack = list(coreach)
+        while stack:
+            for src in preds.get(stack.pop(), []):
+                if src not in coreach:
+                    coreach.add(src)
+                    stack.append(src)
+        if len(coreach) == 0 or len(coreach & set(ini.keys())) == 0:
+            return 0.0
+
+        ren = dict([(st, i) for i, st in enumerate(sorted(coreach))])
+        num = len(ren)
+        sel = [i for i in range(len(rows)) if rows[i] in coreach and cols[i] in coreach]
+        sel_rows = numpy.array([ren[rows[i]] for i in sel], dtype=numpy.int64)
+        sel_cols = numpy.array([ren[cols[i]] for i in sel], dtype=numpy.int64)
+        sel_vals = numpy.array([vals[i] for i in sel], dtype=numpy.float64)
+        fvec = numpy.zeros(num)
+        for st, w in fin.items():
+            if st in ren:
+                fvec[ren[st]] = w
+
+        if num <= DENSE_LIMIT:
+            system = numpy.identity(num)
+            numpy.subtract.at(system, (sel_rows, sel_cols), sel_vals)
+            try:
+                res = numpy.linalg.solve(system, fvec)
+            except numpy.linalg.LinAlgError:
+                raise ValueError("singular system")
+        else:
+            mtx = scipy.sparse.csr_matrix((sel_vals, (sel_rows, sel_cols)), shape=(num, num), dtype=numpy.float64)
+            system = (scipy.sparse.identity(num, dtype=numpy.float64, format="csc") - mtx).tocsc()
+            res = numpy.atleast_1d(scipy.sparse.linalg.spsolve(system, fvec))
+        if not numpy.all(numpy.isfinite(res)):
+            raise ValueError("singular system")
+        return float(sum([w * res[ren[st]] for st, w in ini.items() if st in ren]))
+
+
     def are_states_compatible(self) -> bool:
         """!
         Check whether the states of the WFA are compatible with matrix
@@ -111,17 +261,7 @@ class MatrixWFA(core_wfa.CoreWFA):
         @return Compatibility of states
         """
         states = super(MatrixWFA, self).get_states()
-
-        for i in range(0, len(states)):
-            found = False
-            for state in states:
-                if state == i:
-                    found = True
-                    break
-            if not found:
-                return False
-
-        return True
+        return set(states) == set(range(len(states)))
 
 
     def get_transition_matrix(self, sparse: bool=False) -> numpy.matrix:
@@ -137,16 +277,7 @@ class MatrixWFA(core_wfa.CoreWFA):
 
         if sparse:
             return self._get_transition_matrix_sparse()
-
-        num_states = len(super(MatrixWFA, self).get_states())
-        mtx = numpy.matrix(numpy.empty((num_states,num_states,)))
-        mtx[:] = 0.0
-
-        for transition in super(MatrixWFA, self).get_transitions():
-            mtx[transition.src, transition.dest] \
-                = mtx[transition.src, transition.dest] + transition.weight
-
-        return mtx
+        return self.get_arrays().get_transition_matrix(False)
 
 
     def _get_transition_matrix_sparse(self) -> numpy.matrix:
@@ -158,31 +289,7 @@ class MatrixWFA(core_wfa.CoreWFA):
         if not self.are_states_compatible():
             raise MatrixWFAOperationException("States must be renamed to the set {0,...,n}")
 
-        num_states = len(super(MatrixWFA, self).get_states())
-        tr_dict = super(MatrixWFA, self).get_dictionary_transitions()
-
-        nonzeros = []
-        columns = []
-        row_num = [0]
-
-        for state in range(num_states):
-            row: dict[StateType, float] = {}
-            for transition in tr_dict[state]:
-                try:
-                    row[transition.dest] += transition.weight
-                except KeyError:
-                    row[transition.dest] = transition.weight
-            nonzero_elems = len(row)
-            for key in range(num_states):
-                val = row.get(key, None)
-                if val is not None:
-                    nonzeros.append(val)
-                    columns.append(key)
-            row_num.append(row_num[state] + nonzero_elems)
-
-
-        mtx = scipy.sparse.csr_matrix((nonzeros, columns, row_num), shape=(num_states, num_states), dtype=numpy.float64)
-        return mtx
+        return self.get_arrays().get_transition_matrix(True)
 
 
     def get_final_vector(self, sparse: bool=False) -> numpy.matrix:
@@ -196,12 +303,7 @@ class MatrixWFA(core_wfa.CoreWFA):
         if not self.are_states_compatible():
             raise MatrixWFAOperationException("States must be renamed to the set {0,...,n}")
 
-        num_states = len(super(MatrixWFA, self).get_states())
-        mtx = numpy.matrix(numpy.empty((num_states,)))
-        mtx[:] = 0.0
-
-        for state, weight in super(MatrixWFA, self).get_finals().items():
-            mtx[0, state] = weight
+        mtx = numpy.matrix(self.get_arrays().finals)
         if sparse:
             return scipy.sparse.csr_matrix(mtx)
         else:
@@ -220,15 +322,7 @@ class MatrixWFA(core_wfa.CoreWFA):
         if not self.are_states_compatible():
             raise MatrixWFAOperationException("States must be renamed to the set {0,...,n}")
 
-        num_states = len(super(MatrixWFA, self).get_states())
-        mtx = numpy.matrix(numpy.empty((num_states,)))
-        mtx[:] = 0.0
-
-        for state, weight in super(MatrixWFA, self).get_finals().items():
-            if weight > 0.0:
-                mtx[0, state] = 1.0
-            else:
-                mtx[0, state] = 0.0
+        mtx = numpy.matrix((self.get_arrays().finals > 0.0).astype(numpy.float64))
 
         if sparse:
             return scipy.sparse.csr_matrix(mtx)
@@ -247,11 +341,7 @@ class MatrixWFA(core_wfa.CoreWFA):
         if not self.are_states_compatible():
             raise MatrixWFAOperationException("States must be renamed to the set {0,...,n}")
 
-        num_states = len(super(MatrixWFA, self).get_states())
-        mtx = numpy.matrix(numpy.empty((num_states,)))
-        mtx[:] = 0.0
-        for state, weight in super(MatrixWFA, self).get_starts().items():
-            mtx[0, state] = weight
+        mtx = numpy.matrix(self.get_arrays().starts)
 
         if sparse:
             return scipy.sparse.csr_matrix(mtx)